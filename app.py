@@ -2,36 +2,68 @@ import os
 import string
 import random
 import threading
+import multiprocessing
 import time
 import subprocess
 import logging
-from flask import Flask, render_template, request, redirect, url_for, jsonify, abort, Blueprint
+from flask import Flask, Response, render_template, request, redirect, url_for, jsonify, abort, Blueprint
 from commit_analysis import (
     classify_commits,
     classify_commit,
-    is_merge_commit,
-    get_commit_other_parents,
+    get_branch_index,
     find_merge_commits
     )
-from score import score_all
+from score import new_score_state, score_incremental
 
 from db import (
     list_games,
     create_game_entry,
     get_game,
-    load_game_with_histories,
+    get_games_bulk,
+    load_game_summary,
     update_game_status,
     list_players,
     create_player_entry,
     get_player,
+    get_players_bulk,
+    get_game_and_player,
     update_player_field,
-    append_history_entry,
+    get_leaderboard,
+    get_leaderboard_around,
+    get_player_rank,
+    publish_game_event,
     reset_player,
     get_history,
+    get_history_length,
+    get_history_page,
+    get_history_since,
+    get_history_tail,
+    get_score_state,
+    get_cache_stats,
+    store_new_commits,
+    get_feedback_queue_stats,
+    record_commits_seen,
+    get_freshness_bulk,
+    find_repo_players,
+    index_repo_players,
     populate_db
 )
 
-from llm_analysis import analyze_commits_with_llm
+from feedback_queue import FeedbackWorkerPool
+from metrics import (
+    METRICS_ENABLED,
+    stage,
+    game_context,
+    player_job_seconds,
+    poll_turnaround_seconds,
+    poll_backlog,
+    commits_processed,
+    webhook_deliveries,
+    render_metrics,
+)
+from poll_scheduler import PlayerJobScheduler, AdaptivePollPlanner
+from events import broker
+from webhooks import WEBHOOK_SECRET, WEBHOOK_REF, verify_signature, parse_push
 
 
 # Create a blueprint for the TDD game
@@ -67,6 +99,33 @@ app.logger.setLevel(logging.INFO)
 BASE_CLONE_DIR = os.path.join(os.getcwd(), 'cloned_repos')
 os.makedirs(BASE_CLONE_DIR, exist_ok=True)
 
+# History rows rendered per page; older rows are paged in, newer ones are
+# appended by the page through the /entries endpoint
+HISTORY_PAGE_SIZE = 50
+
+# Which players to poll when (TDD_POLL_MIN_INTERVAL / TDD_POLL_MAX_INTERVAL / TDD_POLL_RATE)
+poll_planner = AdaptivePollPlanner()
+
+
+def poll_job_done(key, new_commits):
+    """Hand a finished job's new-commit count to poll_planner and record its turnaround."""
+    turnaround = poll_planner.record(key, new_commits)
+    if turnaround is not None:
+        poll_turnaround_seconds.observe(turnaround, game=key[0])
+
+
+# Worker pool for per-player poll jobs (size/kind via TDD_POLL_WORKERS / TDD_POLL_EXECUTOR);
+# each job's new-commit count goes back to poll_planner to pick its next poll time
+poll_scheduler = PlayerJobScheduler(on_done=poll_job_done)
+
+# Seconds between checks for due players, and between re-reading the set of
+# players in running games
+POLL_TICK = 0.5
+POLL_SYNC_INTERVAL = 5
+
+# Threads serving the LLM feedback queue (TDD_FEEDBACK_WORKERS)
+feedback_workers = FeedbackWorkerPool()
+
 def generate_id(length=6):
     """Generate a random uppercase alphanumeric ID."""
     chars = string.ascii_uppercase + string.digits
@@ -87,6 +146,37 @@ def parse_full_name(url: str):
         return u.replace('https://github.com/', '')
     return None
 
+def not_modified(etag):
+    """A 304 Not Modified response if the client already holds `etag` (If-None-Match), else None."""
+    if etag not in request.if_none_match:
+        return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
+def conditional_jsonify(etag, build):
+    """
+    Answer a conditional GET: 304 Not Modified if the client already holds
+    `etag` (If-None-Match), otherwise jsonify(build()). Either way the
+    response carries the ETag, so the payload is only built when it changed.
+    """
+    response = not_modified(etag)
+    if response is None:
+        response = jsonify(build())
+        response.set_etag(etag)
+    return response
+
+def history_pager(window: dict, page: int) -> dict:
+    """Add page navigation to a get_history_page window for the templates."""
+    window['page'] = page
+    window['pages'] = max(1, -(-window['total'] // HISTORY_PAGE_SIZE))
+    window['next'] = window['start'] + len(window['entries'])
+    return window
+
+def resource_version(*records):
+    """ETag value from the 'version' counters of game/player hashes (see db.py)."""
+    return '.'.join(str(r.get('version', 0)) for r in records)
+
 def run_subprocess(cmd_list, cwd=None):
     """
     Helper to run a subprocess, returning (exit_code, stdout, stderr).
@@ -141,6 +231,49 @@ def get_commit_count(local_path, sha):
         return None
 
 
+def get_commits_metadata(local_path, shas, head='HEAD', since=None):
+    """
+    Read everything the poller needs about the given SHAs in a single
+    `git log` pass over since..head (the whole history of head if since is
+    empty):
+        { sha: {'message', 'timestamp', 'parents', 'tree', 'parent_tree', 'paths'} }
+    paths are the files modified relative to the first parent (the whole
+    tree for the root commit). The range's boundary commits (parents of its
+    oldest commits) are listed as well, for their trees.
+    Returns None on error.
+    """
+    ret, out, err = run_subprocess(
+        ['git', '-c', 'core.quotePath=false', 'log', '--topo-order', '--reverse', '--boundary',
+         '--diff-merges=first-parent', '--name-only',
+         '--format=%x1e%H%x1f%T%x1f%P%x1f%ct%x1f%B%x1f', f'{since}..{head}' if since else head],
+        cwd=local_path
+    )
+    if ret != 0:
+        return None
+
+    wanted = set(shas)
+    trees = {}
+    records = []
+    for record in out.split('\x1e'):
+        if not record.strip():
+            continue
+        sha, tree, parents, timestamp, message, paths = record.split('\x1f', 5)
+        trees[sha] = tree
+        if sha in wanted:
+            records.append((sha, tree, parents.split(), timestamp, message, paths))
+    metadata = {}
+    for sha, tree, parents, timestamp, message, paths in records:
+        metadata[sha] = {
+            'message':     message.strip(),
+            'timestamp':   int(timestamp),
+            'parents':     parents,
+            'tree':        tree,
+            'parent_tree': trees.get(parents[0]) if parents else None,
+            'paths':       [p for p in paths.strip().splitlines() if p],
+        }
+    return metadata
+
+
 def fetch_new_commits(local_path, last_commit, branch='main'):
     """
     If last_commit is None:
@@ -164,16 +297,50 @@ def fetch_new_commits(local_path, last_commit, branch='main'):
             return None
         return [line.strip() for line in out.splitlines() if line.strip()]
 
+def is_local_player(player_data) -> bool:
+    """Players with is_local set work in repo_path directly (no clone/pull); Redis stores '0'/'1'."""
+    return str(player_data.get('is_local', '0')) in ('1', 'True')
+
+
+def get_head_ref(local_path, local, branch='main'):
+    """
+    SHA the player's branch points to, from a single ref query: `git ls-remote`
+    against origin for cloned repos (one network round trip, nothing fetched),
+    `git rev-parse` for local ones. Returns None if it cannot be read.
+    """
+    if local:
+        ret, out, err = run_subprocess(['git', 'rev-parse', '--verify', '-q', f'refs/heads/{branch}'],
+                                       cwd=local_path)
+    else:
+        ret, out, err = run_subprocess(['git', 'ls-remote', 'origin', f'refs/heads/{branch}'],
+                                       cwd=local_path)
+    if ret != 0 or not out:
+        return None
+    return out.split()[0]
+
+
 def initialize_or_pull_repo(game_id, player_id, player_data):
     """
     Ensure that the repo is cloned under BASE_CLONE_DIR/game_id/player_id.
-    If not yet cloned, do 'git clone'. Then always attempt 'git pull' to bring it up to date.
+    If not yet cloned, do 'git clone'. Then attempt 'git pull' to bring it up to date,
+    unless the remote main still points at last_commit (see get_head_ref): an
+    unchanged repo costs one ls-remote and returns (last_commit, None, []) without
+    touching the working copy or writing player data (only the stage timing
+    is recorded).
 
     Finally:
       - Compute new HEAD commit hash
       - Compute commit_count for the new HEAD
       - Return (new_head, commit_count, list_of_new_shas) or (None, None, None) on error.
     """
+    local = is_local_player(player_data)
+    last_commit = player_data.get('last_commit')
+    repo_path = player_data.get('repo_path')
+    if last_commit and repo_path and os.path.isdir(os.path.join(repo_path, '.git')):
+        with stage('git_ls_remote'):
+            head_ref = get_head_ref(repo_path, local)
+        if head_ref == last_commit:
+            return (last_commit, None, [])
 
     game = get_game(game_id)
     if not game:
@@ -188,10 +355,11 @@ def initialize_or_pull_repo(game_id, player_id, player_data):
 
 
     # 1) If the directory doesn't exist, do a 'git clone <url> <local_path>'
-    if not os.path.isdir(os.path.join(local_path, '.git')) and not player.get('is_local', '0') == '1':
+    if not os.path.isdir(os.path.join(local_path, '.git')) and not local:
         clone_url = f"https://github.com/{player_data['repo_full_name']}.git"
         print(f"cloning {clone_url} into {local_path}")
-        ret, out, err = run_subprocess(['git', 'clone', clone_url, local_path])
+        with stage('git_clone'):
+            ret, out, err = run_subprocess(['git', 'clone', clone_url, local_path])
         if ret != 0:
             print("Error", ret, out, err)
             update_player_field(game_id, player_id,
@@ -199,7 +367,8 @@ def initialize_or_pull_repo(game_id, player_id, player_data):
                                 f"Error cloning: {err}")
             return (None, None, None)
 
-    ret, out, err = run_subprocess(['git', 'checkout', 'main'], cwd=local_path)
+    with stage('git_checkout'):
+        ret, out, err = run_subprocess(['git', 'checkout', 'main'], cwd=local_path)
     if ret != 0:
         update_player_field(game_id, player_id,
                             'latest_feedback',
@@ -207,9 +376,10 @@ def initialize_or_pull_repo(game_id, player_id, player_data):
         return (None, None, None)
 
     # 2) Do 'git pull' inside local_path
-    if not player_data.get('is_local', False):
+    if not local:
 
-        ret, out, err = run_subprocess(['git', 'pull'], cwd=local_path)
+        with stage('git_pull'):
+            ret, out, err = run_subprocess(['git', 'pull'], cwd=local_path)
         if ret != 0:
             update_player_field(game_id, player_id,
                             'latest_feedback',
@@ -239,132 +409,192 @@ def initialize_or_pull_repo(game_id, player_id, player_data):
     return (head_hash, commit_count, new_shas)
 
 
-def poll_repos_loop():
+def process_player(game_id, player_id):
+    """Run _process_player with its stages labeled by game and its duration recorded."""
+    with game_context(game_id), player_job_seconds.time(game=game_id):
+        return _process_player(game_id, player_id)
+
+
+def _process_player(game_id, player_id):
     """
-    Background thread that every 5 seconds:
-    - Iterates over all RUNNING games
-    - For each player in each game:
+    One pull -> classify -> score -> feedback cycle for a single player:
         * Clones (if missing) or pulls their repo
         * Checks HEAD vs. last_commit
         * For each new commit SHA (in chronological order):
-            - Compute its commit_count
             - Get its commit message
-            - Call the LLM to get per‐commit feedback
-            - Append {commit, score, feedback} to player_data['history']
-        * Update player_data['last_commit'] to the newest SHA
-        * Keep player_data['score'] and player_data['latest_feedback'] in sync
-    """
-    while True:
-        time.sleep(5)
-        app.logger.info("Polling...")
-        for game_id in list_games():
-            game_data = load_game_with_histories(game_id)
-            if game_data['status'] != 'running':
-                continue
-            for player_id in list_players(game_id):
-                player_data = game_data['players'].get(player_id)
-                # If the game was paused/stopped in the meantime, skip
-                if game_data['status'] != 'running':
-                    continue
-
-                new_head, _, new_shas = initialize_or_pull_repo(game_id, player_id, player_data)
-                print(new_shas)
-                if new_head is None:
-                    # Error message is already in player_data['latest_feedback']
-                    continue
-
-                #classify_commits(player_data.get('repo_path'))
-                last_head = player_data.get('last_commit')
-                print('last head: ', last_head)
-                if not new_shas:
-                    # No new commits → skip
-                    continue
-
-                # Process each new commit SHA in chronological order (only for main)
-                new_entries = []
-                while len(new_shas) > 0:
-                    sha = new_shas.pop(0)
-                    # Compute commit_count for this SHA
-                    count = get_commit_count(player_data['repo_path'], sha) or 0
-
-                    # Retrieve the commit message for this SHA
-                    msg = get_commit_message(player_data['repo_path'], sha) or "(no commit message)"
-
-                    if is_merge_commit(player_data['repo_path'], sha):
-                        app.logger.info(f'commmit {sha} is merge')
-                        analysis = classify_commit(player_data['repo_path'], sha)
-                        # we call analysis because we need the other fields
-                        # but we rewrite classify, because we know it is a merge
-                        # TODO: clean this, merge detection should be inside classify
-                        analysis['commit_classify'] = 'merge'
-                        #other = get_commit_other_parents(player_data['repo_path'],
-                        #                                 sha)
-                        # app.logger.info(f'retrieving other commits from {other}')
-
-                        # for otherbranch in other[::-1]:
-                        #     other_commits = get_all_commit_shas(
-                        #         player_data['repo_path'], branch=otherbranch)
-                        #     app.logger.info(f'added other commmits {other_commits} from {otherbranch}')
-                        #     for othersha in other_commits:
-                        #         if othersha not in processed_shas:
-                        #             new_shas.insert(0, othersha)
-                        #             other_branch_shas[othersha] = otherbranch
-                        # app.logger.info(f'commmit {sha} merge from {other}')
-
-                    else:
-                        analysis = classify_commit(player_data['repo_path'], sha)
-
-
-                    # Append to history
-                    entry = {
-                        "commit": sha,
-                        "branches": get_commit_other_parents(
-                            player_data['repo_path'],sha),
-                        "feedback": '',
-                        "analysis": analysis,
-                        "is_merge": False,
-                    }
-                    new_entries.append(entry)
-
-                # Finally, set last_commit to the newest SHA (the last element of new_shas)
-                update_player_field(game_id, player_id, 'last_commit', new_head)
-                print(f'player {player_id} last commit {new_head}')
-
-                # detect merges
-                find_merge_commits(new_entries)
-
-                # scores are computed last
-                score = score_all(player_data['history'] + new_entries)
-
-                # Call LLM to analyze single commits
-
-                feedback = analyze_commits_with_llm(new_entries)
-                print(feedback)
-
-                pc_feedback = feedback['per_commit_feedback']
-                for i in range(len(new_entries)):
-                    new_entries[i]['feedback'] = pc_feedback[i]['feedback']
-                    if new_entries[i]['commit'] != pc_feedback[i]['commit']:
-                        print('WARNING: commit sha does not match in feedback')
+            - Append {commit, analysis, ...} to the player's history
+        * Update last_commit to the newest SHA
+        * Keep score in sync and publish it
+        * Queue an LLM feedback job for the new commits (see feedback_queue.py)
 
+    Runs on a poll_scheduler worker; returns the number of new commits processed.
+    """
+    # If the game was paused/stopped since the job was queued, skip
+    game = get_game(game_id)
+    if not game or game['status'] != 'running':
+        return 0
+
+    player_data = get_player(game_id, player_id)
+    if not player_data:
+        return 0
+
+    new_head, _, new_shas = initialize_or_pull_repo(game_id, player_id, player_data)
+    fetched_at = time.time()
+    print(new_shas)
+    if new_head is None:
+        # Error message is already in player_data['latest_feedback']
+        return 0
+
+    #classify_commits(player_data.get('repo_path'))
+    last_head = player_data.get('last_commit')
+    print('last head: ', last_head)
+    if not new_shas:
+        # No new commits → skip
+        return 0
+    num_new = len(new_shas)
+
+    # analyses of the latest classified commits, so parents are not
+    # re-tested (older parents are found in the tree cache)
+    known_results = {e['commit']: e['analysis']
+                     for e in get_history_tail(game_id, player_id, 50)}
+
+    # Messages, parents and modified paths of all new SHAs in one git call over
+    # last_head..new_head
+    with stage('git_log'):
+        metadata = get_commits_metadata(player_data['repo_path'], new_shas, new_head,
+                                        last_head)
+    if metadata is None:
+        update_player_field(game_id, player_id,
+                            'latest_feedback',
+                            "Error reading commit metadata.")
+        return 0
+
+    # Which branches contain which commits, refreshed once for this poll
+    with stage('branch_index'):
+        branch_index = get_branch_index(player_data['repo_path'])
+
+    # Process each new commit SHA in chronological order (only for main)
+    new_entries = []
+    # sha -> (commit timestamp, fetch time, classification time), for freshness
+    commit_times = {}
+    while len(new_shas) > 0:
+        sha = new_shas.pop(0)
+        meta = metadata[sha]
+
+        # The commit message for this SHA
+        msg = meta['message'] or "(no commit message)"
+
+        if len(meta['parents']) > 1:
+            app.logger.info(f'commmit {sha} is merge')
+            with stage('classify'):
+                analysis = classify_commit(player_data['repo_path'], sha, known_results, meta)
+            # we call analysis because we need the other fields
+            # but we rewrite classify, because we know it is a merge
+            # TODO: clean this, merge detection should be inside classify
+            analysis['commit_classify'] = 'merge'
+            #other = get_commit_other_parents(player_data['repo_path'],
+            #                                 sha)
+            # app.logger.info(f'retrieving other commits from {other}')
+
+            # for otherbranch in other[::-1]:
+            #     other_commits = get_all_commit_shas(
+            #         player_data['repo_path'], branch=otherbranch)
+            #     app.logger.info(f'added other commmits {other_commits} from {otherbranch}')
+            #     for othersha in other_commits:
+            #         if othersha not in processed_shas:
+            #             new_shas.insert(0, othersha)
+            #             other_branch_shas[othersha] = otherbranch
+            # app.logger.info(f'commmit {sha} merge from {other}')
+
+        else:
+            with stage('classify'):
+                analysis = classify_commit(player_data['repo_path'], sha, known_results, meta)
+        known_results[sha] = analysis
+        commit_times[sha] = (meta['timestamp'], fetched_at, time.time())
+
+
+        # Append to history
+        entry = {
+            "commit": sha,
+            "message": msg,
+            "branches": branch_index.branches_containing(sha),
+            "feedback": '',
+            "analysis": analysis,
+            "is_merge": False,
+        }
+        new_entries.append(entry)
+
+    # detect merges
+    find_merge_commits(new_entries, branch_index)
+
+    # scores are computed last, on top of the player's running aggregates;
+    # if those are missing or out of step with the history, rebuild them once
+    with stage('score'):
+        score_state = get_score_state(game_id, player_id)
+        if score_state is None or score_state['count'] != get_history_length(game_id, player_id):
+            score_state = new_score_state()
+            score_incremental(score_state, get_history(game_id, player_id))
+        score = score_incremental(score_state, new_entries)
+
+    # Entries are stored without feedback; the LLM runs on a feedback_queue
+    # worker, which patches it in when it arrives. Entries, score and
+    # last_commit (the newest SHA) are written in one transaction, so if it
+    # fails the next poll processes the same commits again.
+    with stage('redis_write'):
+        record_commits_seen(game_id, player_id, commit_times)
+        store_new_commits(game_id, player_id, new_entries, score_state,
+                          score['overall_score'], new_head)
+    print(f'player {player_id} last commit {new_head}')
+    commits_processed.inc(num_new, game=game_id)
+
+    # Push the new score and leaderboard to open dashboards
+    publish_game_event(game_id, 'score', {
+        'player_id': player_id,
+        'status': game['status'],
+        'score': score['overall_score'],
+        'message': player_data['latest_feedback']
+    })
+    publish_leaderboard(game_id)
+    return num_new
 
-                for entry in new_entries:
-                    append_history_entry(game_id, player_id, entry)
 
+def publish_leaderboard(game_id):
+    """Push the current leaderboard to open pages (after any score or membership change)."""
+    publish_game_event(game_id, 'leaderboard', {'players': get_leaderboard(game_id)})
 
-                #print('score: ', score)
 
-                # update scores in the history
-                #for sha in score['per_commit']:
+def running_players() -> list:
+    """(game_id, player_id) of every player in a RUNNING game."""
+    return [(game_id, player_id)
+            for game_id, game in get_games_bulk(list_games()).items()
+            if game and game['status'] == 'running'
+            for player_id in list_players(game_id)]
 
 
-                # Update top‐level score & latest_feedback for admin
-                update_player_field(game_id, player_id, 'score',
-                                    score['overall_score'])
-                player_data['latest_feedback'] = feedback['overall_feedback']
-                update_player_field(game_id, player_id,
-                                    'latest_feedback',
-                                    player_data['latest_feedback'])
+def poll_repos_loop():
+    """
+    Background thread that:
+    - Every POLL_SYNC_INTERVAL seconds hands the players of all RUNNING
+      games to poll_planner (new players are due at once, players of
+      paused/stopped games are dropped)
+    - Every POLL_TICK seconds hands each player poll_planner says is due
+      to poll_scheduler (see process_player). Active players come up every
+      few seconds, idle ones back off, and the total rate is capped.
+    """
+    last_sync = 0
+    while True:
+        time.sleep(POLL_TICK)
+        if time.monotonic() - last_sync >= POLL_SYNC_INTERVAL:
+            last_sync = time.monotonic()
+            poll_planner.sync(running_players())
+            stats = poll_scheduler.stats()
+            poll_backlog.set(stats['queued'], state='queued')
+            poll_backlog.set(stats['in_flight'], state='in_flight')
+            app.logger.info(f"Poll jobs: {stats['queued']} queued, "
+                            f"{stats['in_flight']} in flight")
+        for game_id, player_id in poll_planner.due():
+            # a still-pending job reports back to poll_planner when it ends
+            poll_scheduler.submit((game_id, player_id), process_player, game_id, player_id)
 
 
 
@@ -378,8 +608,9 @@ def index():
     """Home page: let user create a new game or join an existing one."""
     # Build a dict of all games we know about
     games = {}
-    for game_id in list_games():
-        game = get_game(game_id)
+    for game_id, game in get_games_bulk(list_games()).items():
+        if not game:
+            continue
         # meta is a dict with 'name' and 'status' strings
         games[game_id] = {
             'name': game.get('name', ''),
@@ -417,12 +648,19 @@ def create_game():
 @tdd_game_bp.route('/admin/<game_id>')
 def admin_dashboard(game_id):
     """Show admin dashboard for a given game."""
-    game = load_game_with_histories(game_id)
+    game = load_game_summary(game_id)
     print(game)
     if game is None:
         abort(404, description="Game not found")
 
-    return render_template('admin.html', game_id=game_id, game=game)
+    # pending commits and push-to-feedback lag per player
+    freshness = get_freshness_bulk(game_id, list(game['players']))
+    # seconds until each player's next poll (None: polling now / not scheduled)
+    now = time.time()
+    next_polls = {pid: state['next_poll'] and max(0, state['next_poll'] - now)
+                  for (gid, pid), state in poll_planner.snapshot().items() if gid == game_id}
+    return render_template('admin.html', game_id=game_id, game=game, freshness=freshness,
+                           next_polls=next_polls)
 
 
 @tdd_game_bp.route('/pause_game/<game_id>', methods=['POST'])
@@ -432,6 +670,7 @@ def pause_game(game_id):
     if not game:
         abort(404)
     update_game_status(game_id, 'paused')
+    publish_game_event(game_id, 'status', {'status': 'paused'})
     return redirect(url_for('tdd_game_bp.admin_dashboard', game_id=game_id))
 
 
@@ -442,6 +681,7 @@ def resume_game(game_id):
     if not game:
         abort(404,description="Game not found")
     update_game_status(game_id, 'running')
+    publish_game_event(game_id, 'status', {'status': 'running'})
     return redirect(url_for('tdd_game_bp.admin_dashboard', game_id=game_id))
 
 
@@ -453,6 +693,7 @@ def stop_game(game_id):
         abort(404,description="Game not found")
 
     update_game_status(game_id, 'stopped')
+    publish_game_event(game_id, 'status', {'status': 'stopped'})
     return redirect(url_for('tdd_game_bp.admin_dashboard', game_id=game_id))
 
 
@@ -492,8 +733,7 @@ def join_game():
 
     # Check if this repo is already registered in this game
     players = list_players(game_id)
-    for pid in players:
-        p = get_player(game_id, pid)      # dict with name, score, etc.
+    for pid, p in get_players_bulk(game_id, players).items():
         if p['repo_full_name'].lower() == repo_full_name.lower():
             return "That repository is already registered by another player in this game", 400
 
@@ -514,19 +754,22 @@ def join_game():
         'history': []
     }
     create_player_entry(game_id, player_id, player_data)
+    publish_leaderboard(game_id)
     return redirect(url_for('tdd_game_bp.player_view', game_id=game_id, player_id=player_id))
 
 @tdd_game_bp.route('/player/<game_id>/<player_id>')
 def player_view(game_id, player_id):
 
     """Show the player's dashboard: their score, feedback, and a global scoreboard."""
-    game = load_game_with_histories(game_id)
+    game = load_game_summary(game_id)
     if not game:
         abort(404,description="Game not found")
 
     player = game['players'].get(player_id)
     if not player:
         abort(404, description="Player not found")
+    window = get_history_page(game_id, player_id, 1, HISTORY_PAGE_SIZE)
+    player['history'] = window['entries']
 
 
     # Pass the entire players dict for the scoreboard
@@ -535,21 +778,23 @@ def player_view(game_id, player_id):
         game_id=game_id,
         player_id=player_id,
         player=player,
-        players=game['players']
+        players=game['players'],
+        history=history_pager(window, 1)
     )
 
 @tdd_game_bp.route('/admin/<game_id>/<player_id>')
 def admin_player_view(game_id, player_id):
-    game = get_game(game_id)
+    game, player = get_game_and_player(game_id, player_id)
     if not game:
         abort(404, "Game not found")
 
-    player = get_player(game_id, player_id)
     if not player:
         abort(404, "Player not found")
 
-    # Load full commit history
-    player['history'] = get_history(game_id, player_id)
+    # Load one page of the commit history (?page=, newest first)
+    page = max(request.args.get('page', 1, type=int), 1)
+    window = get_history_page(game_id, player_id, page, HISTORY_PAGE_SIZE)
+    player['history'] = window['entries']
     # Ensure a paused flag is available
     player['paused'] = player.get('paused', False)
 
@@ -557,7 +802,8 @@ def admin_player_view(game_id, player_id):
         'admin_player.html',
         game_id=game_id,
         player_id=player_id,
-        player=player
+        player=player,
+        history=history_pager(window, page)
     )
 @tdd_game_bp.route('/admin/<game_id>/<player_id>/pause', methods=['POST'])
 def pause_player(game_id, player_id):
@@ -578,7 +824,14 @@ def reset_history(game_id, player_id):
 
     # Clear the Redis list that holds their history
     reset_player(game_id, player_id)
-
+    game = get_game(game_id)
+    publish_game_event(game_id, 'score', {
+        'player_id': player_id,
+        'status': game['status'] if game else '',
+        'score': 0,
+        'message': '',
+    })
+    publish_leaderboard(game_id)
 
     return redirect(url_for('tdd_game_bp.admin_player_view', game_id=game_id, player_id=player_id))
 
@@ -586,16 +839,16 @@ def reset_history(game_id, player_id):
 def get_score(game_id, player_id):
     """
     Return JSON with the player's latest status, score, and latest feedback.
-    Clients will poll this endpoint every few seconds.
+    Clients will poll this endpoint every few seconds, sending If-None-Match
+    so an unchanged player gets a 304.
     """
-    game = get_game(game_id)
+    game, player = get_game_and_player(game_id, player_id)   # dicts with status / name, score, etc.
     if not game:
         return jsonify({'error': 'Game not found'}), 404
-    player = get_player(game_id, player_id)      # dict with name, score, etc.
     if not player:
         return jsonify({'error': 'Player not found'}), 404
 
-    return jsonify({
+    return conditional_jsonify(resource_version(game, player), lambda: {
         'status': game['status'],
         'score': player['score'],
         'message': player['latest_feedback']
@@ -611,11 +864,10 @@ def scoreboard_view(game_id):
     if not game:
         abort(404, "Game not found")
 
-    # Load all players and their scores
+    # Load all players and their scores, best first
     players = {}
-    for pid in list_players(game_id):
-        pdata = get_player(game_id, pid)
-        players[pid] = { 'name': pdata['name'], 'score': float(pdata.get('score', 0)) }
+    for p in get_leaderboard(game_id):
+        players[p['id']] = { 'name': p['name'], 'score': p['score'] }
 
     return render_template(
         'scoreboard.html',
@@ -624,37 +876,166 @@ def scoreboard_view(game_id):
         players=players
     )
 
+@tdd_game_bp.route('/stream/<game_id>')
+def game_stream(game_id):
+    """
+    Server-Sent Events stream of a game's 'score', 'leaderboard', 'feedback'
+    and 'status' events. ?player=<player_id> drops other players' per-player events.
+    """
+    if not get_game(game_id):
+        abort(404, "Game not found")
+    return Response(
+        broker.stream(game_id, request.args.get('player')),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@tdd_game_bp.route('/admin/poller')
+def poller_status():
+    """Queue depth and in-flight job counts of the background poller."""
+    stats = poll_scheduler.stats()
+    stats['classification_cache'] = get_cache_stats()
+    stats['stream_clients'] = broker.client_count()
+    stats['feedback_queue'] = feedback_workers.stats()
+    stats['next_polls'] = {f'{game_id}/{player_id}': state
+                           for (game_id, player_id), state in poll_planner.snapshot().items()}
+    return jsonify(stats)
+
+@tdd_game_bp.route('/webhook/push', methods=['POST'])
+def push_webhook():
+    """
+    GitHub-style push webhook (see webhooks.py): players registered with the
+    pushed repository are polled right away instead of on their next poll.
+    """
+    if not WEBHOOK_SECRET:
+        abort(404, description="Webhooks are disabled (TDD_WEBHOOK_SECRET is not set)")
+    body = request.get_data()
+    if not verify_signature(body, request.headers.get('X-Hub-Signature-256', ''), WEBHOOK_SECRET):
+        webhook_deliveries.inc(outcome='bad_signature')
+        abort(403, description="Bad webhook signature")
+
+    event = request.headers.get('X-GitHub-Event', 'push')
+    if event == 'ping':
+        return jsonify({'ok': True})
+    try:
+        push = parse_push(request.get_json(silent=True)) if event == 'push' else None
+    except ValueError as e:
+        webhook_deliveries.inc(outcome='bad_payload')
+        abort(400, description=f"Bad push payload: {e}")
+    if push is None or push[1] != WEBHOOK_REF:
+        webhook_deliveries.inc(outcome='ignored')
+        return jsonify({'ignored': push[1] if push else event}), 202
+
+    repo_full_name, _, after = push
+    players = find_repo_players(repo_full_name)
+    games = get_games_bulk(list({game_id for game_id, _ in players}))
+    polled = [(game_id, player_id) for game_id, player_id in players
+              if games.get(game_id) and games[game_id]['status'] == 'running']
+    for key in polled:
+        poll_planner.poke(key)
+    webhook_deliveries.inc(outcome='poll' if polled else 'unknown_repo')
+    app.logger.info(f"Push to {repo_full_name} ({after[:7] or '?'}): polling {polled}")
+    return jsonify({'repository': repo_full_name,
+                    'players': [f'{game_id}/{player_id}' for game_id, player_id in polled]}), 202
+
+@tdd_game_bp.route('/metrics')
+def metrics_view():
+    """Poller stage timings, counters and backlog in the Prometheus text format."""
+    if not METRICS_ENABLED:
+        abort(404, description="Metrics are disabled (TDD_METRICS=0)")
+    feedback = get_feedback_queue_stats()
+    return Response(render_metrics({
+        'tdd_feedback_backlog': ('Feedback jobs in Redis (state=queued|processing|failed)',
+                                 {f'state="{k}"': v for k, v in feedback.items()}),
+    }), mimetype='text/plain; version=0.0.4')
+
 # JSON endpoint for dynamic updates\
 @tdd_game_bp.route('/player/<game_id>/scores')
 def scoreboard_scores(game_id):
-    if not get_game(game_id):
+    """Leaderboard sorted by score (descending); ?limit=K returns only the top K."""
+    game = get_game(game_id)
+    if not game:
         abort(404, "Game not found")
 
-    data = []
-    for pid in list_players(game_id):
-        pdata = get_player(game_id, pid)
-        data.append({ 'id': pid, 'name': pdata['name'], 'score': float(pdata.get('score', 0)) })
+    limit = request.args.get('limit', type=int)
+    return conditional_jsonify(resource_version(game), lambda: {
+        'players': get_leaderboard(game_id, 0, limit - 1 if limit else -1)
+    })
 
-    # sort descending by score
-    data.sort(key=lambda x: x['score'], reverse=True)
-    print("data", data)
-    return jsonify(players=data)
+@tdd_game_bp.route('/player/<game_id>/rank/<player_id>')
+def player_rank(game_id, player_id):
+    """A player's 0-based rank and score, and the number of ranked players."""
+    game = get_game(game_id)
+    if not game:
+        abort(404, "Game not found")
+    # answer 304 from the version counter alone, before reading the leaderboard
+    cached = not_modified(resource_version(game))
+    if cached is not None:
+        return cached
+    rank = get_player_rank(game_id, player_id)
+    if rank is None:
+        return jsonify({'error': 'Player not found'}), 404
+    return conditional_jsonify(resource_version(game), lambda: rank)
+
+@tdd_game_bp.route('/player/<game_id>/around/<player_id>')
+def leaderboard_around(game_id, player_id):
+    """The leaderboard window around a player (?radius=N players above/below, default 2)."""
+    game = get_game(game_id)
+    if not game:
+        abort(404, "Game not found")
+    cached = not_modified(resource_version(game))
+    if cached is not None:
+        return cached
+    radius = request.args.get('radius', default=2, type=int)
+    data = get_leaderboard_around(game_id, player_id, radius)
+    if not data:
+        return jsonify({'error': 'Player not found'}), 404
+    return conditional_jsonify(resource_version(game), lambda: {'players': data})
 
 @tdd_game_bp.route('/history/<game_id>/<player_id>')
 def history_for_player(game_id, player_id):
     """
     Show commit history for a specific game and player.
     """
-    game = get_game(game_id)
+    game, player = get_game_and_player(game_id, player_id)
     if not game:
         abort(404, description="Game not found")
-    player = get_player(game_id, player_id)
     if not player:
         abort(404, description="Player not found")
 
-    player['history'] = get_history(game_id, player_id)
-    # Render a page showing this player's full commit history
-    return render_template('history.html', game_id=game_id, player=player)
+    page = max(request.args.get('page', 1, type=int), 1)
+    window = get_history_page(game_id, player_id, page, HISTORY_PAGE_SIZE)
+    player['history'] = window['entries']
+    # Render one page of this player's commit history (?page=, newest first)
+    return render_template('history.html', game_id=game_id, player_id=player_id,
+                           player=player, history=history_pager(window, page))
+
+
+@tdd_game_bp.route('/history/<game_id>/<player_id>/entries')
+def history_entries(game_id, player_id):
+    """
+    JSON window of a player's history:
+      ?since=<index>  only the entries from that index on (what the client has not seen yet)
+      ?page=<n>       otherwise the n-th page, newest first (default 1)
+      ?limit=<n>      page / delta size (default HISTORY_PAGE_SIZE)
+    Entries are chronological; 'start' is the index of the first one and
+    'next' the `since` cursor for the following request.
+    """
+    game, player = get_game_and_player(game_id, player_id)
+    if not game:
+        abort(404, description="Game not found")
+    if not player:
+        abort(404, description="Player not found")
+
+    limit = min(max(request.args.get('limit', HISTORY_PAGE_SIZE, type=int), 1), 1000)
+    since = request.args.get('since', type=int)
+    if since is not None:
+        window = get_history_since(game_id, player_id, max(since, 0), limit)
+    else:
+        page = max(request.args.get('page', 1, type=int), 1)
+        window = get_history_page(game_id, player_id, page, limit)
+    window['next'] = window['start'] + len(window['entries'])
+    return jsonify(window)
 
 
 # -----------------------------------------------------------------------------
@@ -664,6 +1045,7 @@ def start_polling_thread():
     app.logger.info("Starting polling thread...")
     thread = threading.Thread(target=poll_repos_loop, daemon=True)
     thread.start()
+    feedback_workers.start()
 
 
 # -----------------------------------------------------------------------------
@@ -672,9 +1054,13 @@ def start_polling_thread():
 
 app.register_blueprint(tdd_game_bp)
 
-populate_db()
+# Poll worker processes (TDD_POLL_EXECUTOR=process) import this module to run
+# process_player; only the main process seeds the DB and starts polling.
+if multiprocessing.parent_process() is None:
+    populate_db()
+    index_repo_players()
 
-start_polling_thread()
+    start_polling_thread()
 
 
 if __name__ == '__main__':
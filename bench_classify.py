@@ -0,0 +1,206 @@
+# bench_classify.py
+# Throughput benchmark of commit classification and scoring on synthetic katas:
+#
+#   python bench_classify.py --output bench_baseline.json   # record a baseline
+#   python bench_classify.py --compare bench_baseline.json  # writes bench_current.json
+#
+# For every scenario a kata repo is generated (synthetic_kata.py) and the
+# poller's stages are timed over all of its commits:
+#   branch_index     BranchIndex built from scratch
+#   metadata         read_commit_metadata per commit
+#   classify         classify_commit per commit, cold classification cache
+#   classify_cached  the same again, every tree/refactor result cached
+#   detect_refactoring  detect_refactoring on each pair of calc.py versions
+#   find_merges      find_merge_commits over the entries
+#   score_all        score_all over the whole history
+#   score_incremental  score_incremental one commit at a time
+# Timings go to a JSON file; with --compare, stages slower than the baseline
+# by more than --tolerance are reported and the exit status is 1.
+#
+# Needs Redis (classification cache), git and pytest.
+
+import argparse
+import copy
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+from commit_analysis import (
+    BranchIndex,
+    classify_commit,
+    find_merge_commits,
+    read_commit_metadata,
+)
+from refactor_check import detect_refactoring
+from score import new_score_state, score_all, score_incremental
+from synthetic_kata import generate_kata_repo, run_git
+
+SCENARIOS = {
+    'linear':     dict(commits=30),
+    'branches':   dict(commits=60, branches=6, merge_style='merge'),
+    'fastforward': dict(commits=60, branches=6, merge_style='ff'),
+    'big-suite':  dict(commits=30, suite_size=300),
+    'messy':      dict(commits=45, mix={'red': 1, 'green': 1, 'refactor': 1, 'mixed': 2}),
+}
+
+# Stages faster than this (seconds) are too noisy to flag as regressions
+MIN_REGRESSION_SECONDS = 0.01
+
+
+class StageTimer:
+    def __init__(self):
+        self.stages = {}
+
+    def time(self, name, fn, *args, **kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.stages[name] = time.perf_counter() - start
+        return result
+
+
+def _build_index(repo_path: str) -> BranchIndex:
+    index = BranchIndex(repo_path)
+    index.refresh()
+    return index
+
+
+def _read_metadata(repo_path: str, shas: list) -> dict:
+    return {sha: read_commit_metadata(repo_path, sha) for sha in shas}
+
+
+def _score_one_by_one(entries: list) -> dict:
+    state = new_score_state()
+    for entry in entries:
+        result = score_incremental(state, [entry])
+    return result
+
+
+def _calc_versions(repo_path: str, shas: list) -> list:
+    """calc.py of each commit (None where it is absent)."""
+    versions = []
+    for sha in shas:
+        try:
+            versions.append(run_git(repo_path, 'show', f'{sha}:calc.py'))
+        except Exception:
+            versions.append(None)
+    return versions
+
+
+def _detect_all(workdir: str, versions: list) -> int:
+    old_path, new_path = os.path.join(workdir, 'old.py'), os.path.join(workdir, 'new.py')
+    count = 0
+    for old, new in zip(versions, versions[1:]):
+        if old is None or new is None:
+            continue
+        with open(old_path, 'w', encoding='utf-8') as f:
+            f.write(old)
+        with open(new_path, 'w', encoding='utf-8') as f:
+            f.write(new)
+        detect_refactoring(old_path, new_path)
+        count += 1
+    return count
+
+
+def _classify_all(repo_path: str, shas: list, metadata: dict) -> list:
+    known = {}
+    analyses = []
+    for sha in shas:
+        analysis = classify_commit(repo_path, sha, known, metadata[sha])
+        if len(metadata[sha]['parents']) > 1:
+            analysis['commit_classify'] = 'merge'
+        known[sha] = analysis
+        analyses.append(analysis)
+    return analyses
+
+
+def run_scenario(name: str, params: dict, workdir: str) -> dict:
+    timer = StageTimer()
+    repo_path = os.path.join(workdir, name)
+    # a fresh salt so the classify stage really starts from a cold cache
+    timer.time('generate', generate_kata_repo, repo_path, salt=uuid.uuid4().hex, **params)
+    shas = run_git(repo_path, 'rev-list', '--topo-order', '--reverse', 'main').split()
+
+    index = timer.time('branch_index', _build_index, repo_path)
+    metadata = timer.time('metadata', _read_metadata, repo_path, shas)
+    analyses = timer.time('classify', _classify_all, repo_path, shas, metadata)
+    timer.time('classify_cached', _classify_all, repo_path, shas, metadata)
+
+    versions = _calc_versions(repo_path, shas)
+    timer.time('detect_refactoring', _detect_all, workdir, versions)
+
+    entries = [{'commit': sha, 'branches': index.branches_containing(sha), 'feedback': '',
+                'analysis': analysis, 'is_merge': False}
+               for sha, analysis in zip(shas, analyses)]
+    timer.time('find_merges', find_merge_commits, entries, index)
+    timer.time('score_all', score_all, copy.deepcopy(entries))
+    timer.time('score_incremental', _score_one_by_one, copy.deepcopy(entries))
+
+    return {
+        'params':  params,
+        'commits': len(shas),
+        'stages':  {stage: {'seconds': round(seconds, 6),
+                            'per_commit_ms': round(1000 * seconds / max(len(shas), 1), 3)}
+                    for stage, seconds in timer.stages.items()},
+    }
+
+
+def compare(current: dict, baseline: dict, tolerance: float) -> list:
+    """(scenario, stage, baseline s, current s) of every stage slower than allowed."""
+    regressions = []
+    for name, result in current['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if base is None:
+            continue
+        for stage, timing in result['stages'].items():
+            if stage == 'generate' or stage not in base['stages']:
+                continue
+            before, now = base['stages'][stage]['seconds'], timing['seconds']
+            if now > before * (1 + tolerance) and now - before > MIN_REGRESSION_SECONDS:
+                regressions.append((name, stage, before, now))
+    return regressions
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Classification and scoring throughput benchmark")
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help="run only these scenarios (repeatable)")
+    parser.add_argument('--output', default='bench_current.json')
+    parser.add_argument('--compare', help="baseline JSON to check the results against")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed slowdown per stage, as a fraction of the baseline")
+    args = parser.parse_args()
+    if args.compare and os.path.abspath(args.compare) == os.path.abspath(args.output):
+        parser.error("--output would overwrite the --compare baseline")
+
+    workdir = tempfile.mkdtemp(prefix='tdd-bench-classify-')
+    results = {
+        'created':  time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python':   platform.python_version(),
+        'platform': platform.platform(),
+        'scenarios': {},
+    }
+    try:
+        for name in args.scenario or SCENARIOS:
+            print(f"running {name}...", flush=True)
+            result = run_scenario(name, SCENARIOS[name], workdir)
+            results['scenarios'][name] = result
+            for stage, timing in result['stages'].items():
+                print(f"  {stage:20s} {timing['seconds']:8.3f}s  {timing['per_commit_ms']:8.2f} ms/commit")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    print(f"timings written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for name, stage, before, now in regressions:
+            print(f"REGRESSION {name}/{stage}: {before:.3f}s -> {now:.3f}s")
+        sys.exit(1 if regressions else 0)
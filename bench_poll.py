@@ -0,0 +1,139 @@
+# bench_poll.py
+# End-to-end latency benchmark of the poll pipeline against the local LLM stub:
+#
+#   python bench_poll.py --players 4 --commits 30 --interval 1.0
+#
+# Starts llm_stub in the background and points llm_analysis at it, imports
+# app (which starts poll_repos_loop and the feedback workers), registers a
+# throwaway game whose players are synthetic kata repos, and pushes commits
+# into them at a steady rate. A commit counts as scored once it is in the
+# player's stored history (score published). Reports commits/sec and the
+# p50/p99 push-to-score latency, then deletes the game.
+#
+# Needs a running Redis (db.py's redis_client), git and pytest.
+
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+
+import llm_stub
+
+
+def percentile(values: list, p: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return float('nan')
+    index = min(len(ordered) - 1, max(0, round(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def run_benchmark(players: int, commits: int, interval: float, llm_latency: float,
+                  llm_error_rate: float, llm_malformed_rate: float, timeout: float) -> dict:
+    stub = llm_stub.serve(0, latency=llm_latency, jitter=llm_latency / 5,
+                          error_rate=llm_error_rate, malformed_rate=llm_malformed_rate,
+                          background=True)
+    os.environ['AZURE_OPENAI_ENDPOINT'] = f"http://127.0.0.1:{stub.server_port}"
+    os.environ.setdefault('AZURE_OPENAI_KEY', 'stub')
+    os.environ.setdefault('AZURE_OPENAI_DEPLOYMENT_NAME', 'stub')
+    os.environ.setdefault('TDD_LLM_TPM', '0')
+
+    # imported here so llm_analysis picks up the stub endpoint
+    from app import generate_id
+    from db import (create_game_entry, create_player_entry, get_history_length,
+                    redis_client, games_key, game_hash, repo_players_set)
+    from synthetic_kata import KataRepo
+
+    workdir = tempfile.mkdtemp(prefix='tdd-bench-')
+    game_id = 'BENCH-' + generate_id(6)
+    create_game_entry(game_id, 'Poll benchmark', status='running')
+
+    sources, pushed = {}, {}
+    for n in range(players):
+        player_id = f'P{n}'
+        # a fresh salt per repo, so trees are new to the classification and
+        # feedback caches and the poll pipeline does the real work
+        source = KataRepo(os.path.join(workdir, player_id, 'source'), salt=uuid.uuid4().hex)
+        target = os.path.join(workdir, player_id, 'repo')
+        shutil.copytree(source.path, target)
+        create_player_entry(game_id, player_id, {
+            'name': f'Bench {n}',
+            'repo_full_name': f'LOCAL/bench-{n}',
+            'is_local': 1,
+            'last_commit': '',
+            'repo_path': target,
+        })
+        sources[player_id] = (source, target)
+        pushed[player_id] = [time.time()]     # the initial commit
+
+    def pusher(player_id):
+        source, target = sources[player_id]
+        for _ in range(commits):
+            time.sleep(interval)
+            source.next_commit()
+            source.push_to(target)
+            pushed[player_id].append(time.time())
+
+    threads = [threading.Thread(target=pusher, args=(pid,), daemon=True) for pid in sources]
+    started = time.time()
+    for t in threads:
+        t.start()
+
+    # A commit is scored when the history length first covers its index
+    latencies, scored = [], {pid: 0 for pid in sources}
+    total = players * (commits + 1)
+    last_scored = started
+    deadline = started + commits * interval + timeout
+    while sum(scored.values()) < total and time.time() < deadline:
+        now = time.time()
+        for pid in sources:
+            length = get_history_length(game_id, pid)
+            for i in range(scored[pid], min(length, len(pushed[pid]))):
+                latencies.append(now - pushed[pid][i])
+                last_scored = now
+            scored[pid] = max(scored[pid], min(length, len(pushed[pid])))
+        time.sleep(0.05)
+
+    # throw the game away
+    keys = list(redis_client.scan_iter(match=f'tddgame:game:{game_id}:*'))
+    redis_client.delete(game_hash.format(game_id=game_id), *keys)
+    redis_client.srem(games_key, game_id)
+    for n in range(players):
+        redis_client.srem(repo_players_set.format(repo=f'local/bench-{n}'), f'{game_id}/P{n}')
+    shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        'commits':        total,
+        'scored':         len(latencies),
+        'elapsed':        last_scored - started,
+        'commits_per_s':  len(latencies) / max(last_scored - started, 1e-9),
+        'p50_latency':    percentile(latencies, 50),
+        'p99_latency':    percentile(latencies, 99),
+        'mean_latency':   statistics.fmean(latencies) if latencies else float('nan'),
+        'llm_requests':   stub.requests,
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Push-to-score benchmark of the poll pipeline")
+    parser.add_argument('--players', type=int, default=4)
+    parser.add_argument('--commits', type=int, default=30, help="commits pushed per player")
+    parser.add_argument('--interval', type=float, default=1.0, help="seconds between pushes")
+    parser.add_argument('--llm-latency', type=float, default=0.5)
+    parser.add_argument('--llm-error-rate', type=float, default=0.0)
+    parser.add_argument('--llm-malformed-rate', type=float, default=0.0)
+    parser.add_argument('--timeout', type=float, default=120.0,
+                        help="seconds to wait for scoring after the last push")
+    args = parser.parse_args()
+
+    result = run_benchmark(args.players, args.commits, args.interval, args.llm_latency,
+                           args.llm_error_rate, args.llm_malformed_rate, args.timeout)
+    print(f"scored {result['scored']}/{result['commits']} commits "
+          f"in {result['elapsed']:.1f}s ({result['commits_per_s']:.2f} commits/s)")
+    print(f"push-to-score latency: p50 {result['p50_latency']:.2f}s  "
+          f"p99 {result['p99_latency']:.2f}s  mean {result['mean_latency']:.2f}s")
+    print(f"LLM stub requests: {result['llm_requests']}")
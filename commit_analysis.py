@@ -1,34 +1,114 @@
 import git
+import io
+import json
 import os
-import re
+import shutil
+import tarfile
+import tempfile
+import threading
+from contextlib import contextmanager
 from pathlib import Path
 import subprocess
 from refactor_check import detect_refactoring
+from pytest_report_plugin import REPORT_ENV
+from pytest_pool import get_warm_pool, needs_own_environment, PYTEST_TIMEOUT
+from metrics import stage
+from db import (
+    get_cached_tree_result,
+    cache_tree_result,
+    get_cached_refactor_result,
+    cache_refactor_result
+)
 
-def run_tests(repo_path: str) -> bool:
-    """
-    Placeholder function.
-    Should run the test suite at the current HEAD (e.g., via pytest or unittest)
-    and return True if all tests pass, False otherwise.
+# Where commit trees are materialized for testing: tmpfs when available,
+# the system temp dir otherwise. Override with TDD_SNAPSHOT_DIR.
+SNAPSHOT_DIR = os.getenv('TDD_SNAPSHOT_DIR',
+                         '/dev/shm' if os.path.isdir('/dev/shm') else None)
+
+# The bundled pytest plugin lives next to this module
+PLUGIN_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# pytest exit codes that say nothing about the tree (interrupted, internal
+# error, usage error); like a missing report (exitstatus None), such runs
+# are not cached
+UNCACHEABLE_EXIT_STATUSES = (2, 3, 4)
+
+
+def run_pytest(repo_path: str) -> dict:
     """
-    # Example implementation (uncomment and adapt if using pytest):
-    # import subprocess
+    Run the test suite in repo_path once and return the structured result
+    written by pytest_report_plugin:
+      - collected  : number of tests pytest collected
+      - passed     : True if the run exited with status 0
+      - exitstatus : pytest's exit code
+      - outcomes   : { nodeid: "passed" | "failed" | "skipped" | "error" }
+      - timed_out  : True if the run was killed after PYTEST_TIMEOUT seconds
+    If pytest is not found, produces no report or times out, nothing is
+    collected and the run counts as failed (exitstatus None).
 
+    Runs on a warm pytest worker (see pytest_pool) unless the pool is disabled
+    or the repo brings its own environment, in which case a fresh `pytest`
+    subprocess is used.
+    """
     repo_dir = Path(repo_path)
     if not repo_dir.is_dir():
         raise ValueError(f"Invalid repo path: {repo_path!r}")
 
+    report_dir = tempfile.mkdtemp(prefix='tdd-pytest-', dir=SNAPSHOT_DIR)
+    report_path = os.path.join(report_dir, 'report.json')
+    failed = {'collected': 0, 'passed': False, 'exitstatus': None, 'outcomes': {},
+              'timed_out': False}
+    try:
+        pool = get_warm_pool()
+        if pool is not None and not needs_own_environment(repo_path):
+            try:
+                timed_out = pool.run(repo_path, report_path)['timed_out']
+            except RuntimeError as e:
+                print(f"Warm pytest worker failed ({e}), falling back to subprocess")
+                timed_out = _run_pytest_subprocess(repo_path, report_path)
+        else:
+            timed_out = _run_pytest_subprocess(repo_path, report_path)
+        if timed_out:
+            return dict(failed, timed_out=True)
+        with open(report_path, 'r', encoding='utf-8') as f:
+            return dict(json.load(f), timed_out=False)
+    except (FileNotFoundError, json.JSONDecodeError):
+        # pytest command not found, or it died before writing the report
+        return failed
+    finally:
+        shutil.rmtree(report_dir, ignore_errors=True)
+
+
+def _run_pytest_subprocess(repo_path: str, report_path: str) -> bool:
+    """
+    Run pytest (with the report plugin) in a fresh interpreter.
+    Returns True if it was killed after PYTEST_TIMEOUT seconds.
+    """
+    env = dict(os.environ)
+    env[REPORT_ENV] = report_path
+    env['PYTHONPATH'] = os.pathsep.join(
+        p for p in [PLUGIN_DIR, env.get('PYTHONPATH', '')] if p)
     try:
-        result = subprocess.run(
-            ["pytest", "--maxfail=1", "--disable-warnings", "-q"],
+        subprocess.run(
+            ["pytest", "-q", "--disable-warnings",
+             "-p", "pytest_report_plugin", "-p", "no:cacheprovider"],
             cwd=repo_path,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
             text=True,
+            env=env,
+            timeout=PYTEST_TIMEOUT,
         )
-        return (result.returncode == 0)
-    except:
-        raise NotImplementedError("Error")
+    except subprocess.TimeoutExpired:
+        return True
+    return False
+
+
+def run_tests(repo_path: str) -> bool:
+    """
+    Run the test suite in repo_path and return True if all tests pass.
+    """
+    return run_pytest(repo_path)['passed']
 
 
 def count_pytest_tests(repo_path: str) -> int:
@@ -36,62 +116,226 @@ def count_pytest_tests(repo_path: str) -> int:
     Returns the number of tests that pytest is able to collect in the given repository.
     If pytest is not found or no tests are collected, returns 0.
     """
-    repo_dir = Path(repo_path)
-    if not repo_dir.is_dir():
-        raise ValueError(f"Invalid repo path: {repo_path!r}")
+    return run_pytest(repo_path)['collected']
+
 
-    # Run pytest in "collect-only" mode, quiet output gives a summary line like "collected 12 items"
+@contextmanager
+def commit_snapshot(repo: git.Repo, commit_sha: str):
+    """
+    Export the tree of commit_sha (via `git archive`) into a throwaway
+    directory and yield its path; the directory is removed afterwards.
+
+    The repo's own working copy and HEAD are never touched, so several
+    commits of the same repo can be evaluated at the same time.
+    """
+    snapshot_dir = tempfile.mkdtemp(prefix='tdd-snapshot-', dir=SNAPSHOT_DIR)
     try:
-        result = subprocess.run(
-            ["pytest", "--collect-only", "-q"],
-            cwd=repo_path,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            check=False
-        )
-    except FileNotFoundError:
-        # pytest command not found
-        return 0
-    output = result.stdout.strip().lower()
+        with stage('snapshot'):
+            archive = io.BytesIO()
+            repo.archive(archive, treeish=commit_sha, format='tar')
+            archive.seek(0)
+            with tarfile.open(fileobj=archive) as tar:
+                if hasattr(tarfile, 'data_filter'):
+                    tar.extractall(snapshot_dir, filter='data')
+                else:
+                    tar.extractall(snapshot_dir)
+        yield snapshot_dir
+    finally:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+
 
-    # 1) Handle the "no tests collected" case
-    if re.search(r'\bno tests collected\b', output):
-        return 0
+def evaluate_tree(repo_path: str, commit_sha: str, tree_sha: str) -> dict:
+    """
+    Return {'tests_passed': bool, 'ntests': int, 'outcomes': dict} for the
+    source tree of commit_sha, from a single pytest run. A run that failed
+    for reasons outside the tree also has 'inconclusive': True (and
+    'timed_out': True if it timed out).
 
-    # 2) Handle "N test(s) collected"
-    match = re.search(r'\b(\d+)\s+tests?\s+collected\b', output)
-    if match:
-        return int(match.group(1))
+    Results are cached by tree SHA, so a tree that was already tested (same
+    kata template, re-clone, reset_player, ...) skips the snapshot and pytest,
+    and the repo is not even opened. Runs that failed for reasons outside the
+    tree (no report, timeout, UNCACHEABLE_EXIT_STATUSES) are not cached, so
+    the next commit with that tree is tested again.
+    """
+    result = get_cached_tree_result(tree_sha)
+    if result is not None:
+        return result
 
-    # Fallback
-    return 0
+    repo = git.Repo(repo_path)
+    with commit_snapshot(repo, commit_sha) as snapshot_path:
+        with stage('pytest'):
+            report = run_pytest(snapshot_path)
+    result = {
+        'tests_passed': report['passed'],
+        'ntests':       report['collected'],
+        'outcomes':     report['outcomes'],
+    }
+    if report.get('timed_out'):
+        print(f"pytest run for tree {tree_sha[:7]} timed out, not cached")
+        result['timed_out'] = True
+        result['inconclusive'] = True
+        return result
+    status = report['exitstatus']
+    if status is None or status in UNCACHEABLE_EXIT_STATUSES:
+        print(f"pytest run for tree {tree_sha[:7]} ended with status {status}, not cached")
+        result['inconclusive'] = True
+    else:
+        cache_tree_result(tree_sha, result)
+    return result
 
 
-def get_commit_other_parents(repo_path: str, commit_sha: str) -> list:
+def _detect_refactoring_between(repo_path: str, parent_sha: str, commit_sha: str,
+                                filename: str) -> bool:
+    """Run detect_refactoring on the two versions of filename, read straight from the git trees."""
     repo = git.Repo(repo_path)
-     # Only consider parents beyond the first (parent[0] is the “mainline”)
-    branches_output = repo.git.branch('--contains', commit_sha)
-
-    # Parse lines like:
-    #   * main
-    #     feature/foo
-    #     remotes/origin/feature/foo
-    names = []
-    for line in branches_output.splitlines():
-        # strip leading '*' (current HEAD) and whitespace
-        name = line.lstrip('* ').strip()
-        if 'HEAD' in name or 'main' in name:
-            continue
-        names.append(name)
-    return names
+    tmpdir = tempfile.mkdtemp(prefix='tdd-refactor-', dir=SNAPSHOT_DIR)
+    try:
+        old_path = os.path.join(tmpdir, "__old_" + filename)
+        new_path = os.path.join(tmpdir, filename)
+        with open(old_path, "wb") as f:
+            f.write((repo.commit(parent_sha).tree / filename).data_stream.read())
+        with open(new_path, "wb") as f:
+            f.write((repo.commit(commit_sha).tree / filename).data_stream.read())
+        try:
+            with stage('detect_refactoring'):
+                return detect_refactoring(old_path, new_path)
+        except NotImplementedError:
+            return False
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+
+def read_commit_metadata(repo_path: str, commit_sha: str) -> dict:
+    """
+    Parents, tree and modified paths of a single commit, read through GitPython.
+    The poller gets the same dict for many commits at once from
+    app.get_commits_metadata.
+    """
+    repo = git.Repo(repo_path)
+    commit = repo.commit(commit_sha)
+    if commit.parents:
+        diff_entries = commit.diff(commit.parents[0])
+    else:
+        # Root commit: compare against an empty tree
+        diff_entries = commit.diff(git.NULL_TREE)
+    return {
+        'parents':     [p.hexsha for p in commit.parents],
+        'tree':        commit.tree.hexsha,
+        'parent_tree': commit.parents[0].tree.hexsha if commit.parents else None,
+        'paths':       [entry.a_path or entry.b_path for entry in diff_entries],
+    }
+
+
+class BranchIndex:
+    """
+    Which local branches contain each commit of a repo, kept as one bitmask
+    per commit (bit i set <=> branch self.branches[i] contains the commit).
+
+    Built from the branch tips with a single `git rev-list --parents` walk,
+    then updated incrementally on refresh(): a branch that moved forward only
+    walks its new commits, a new branch walks its own history; a deleted or
+    rewound branch triggers a full rebuild. As with `git branch --contains`
+    in get_commit_other_parents, branches whose name mentions HEAD or main
+    are left out.
+    """
+
+    def __init__(self, repo_path: str):
+        self.repo_path = repo_path
+        self.branches = []   # bit -> branch name
+        self.tips = {}       # branch name -> tip sha
+        self.masks = {}      # commit sha -> bitmask of branches containing it
+        self._lock = threading.Lock()
+
+    def _read_tips(self, repo: git.Repo) -> dict:
+        tips = {}
+        refs = repo.git.for_each_ref('--format=%(objectname) %(refname:short)', 'refs/heads')
+        for line in refs.splitlines():
+            sha, name = line.split(' ', 1)
+            if 'HEAD' in name or 'main' in name:
+                continue
+            tips[name] = sha
+        return tips
+
+    def _rebuild(self, repo: git.Repo, tips: dict):
+        self.branches = sorted(tips)
+        self.tips = dict(tips)
+        self.masks = {}
+        if not tips:
+            return
+        for bit, name in enumerate(self.branches):
+            self.masks[tips[name]] = self.masks.get(tips[name], 0) | (1 << bit)
+        # children are listed before their parents, so one pass propagates every bit
+        walk = repo.git.rev_list('--topo-order', '--parents', *set(tips.values()))
+        for line in walk.splitlines():
+            commit, *parents = line.split()
+            mask = self.masks.get(commit, 0)
+            for parent in parents:
+                self.masks[parent] = self.masks.get(parent, 0) | mask
+
+    def _add_commits(self, repo: git.Repo, bit: int, *rev_args):
+        for sha in repo.git.rev_list(*rev_args).split():
+            self.masks[sha] = self.masks.get(sha, 0) | (1 << bit)
+
+    def refresh(self):
+        """Bring the index up to date with the current branch tips."""
+        with self._lock:
+            repo = git.Repo(self.repo_path)
+            tips = self._read_tips(repo)
+            if tips == self.tips:
+                return
+            if not self.tips or any(name not in tips for name in self.tips):
+                self._rebuild(repo, tips)
+                return
+            for name, sha in tips.items():
+                old = self.tips.get(name)
+                if old == sha:
+                    continue
+                if old is None:
+                    self.branches.append(name)
+                    self._add_commits(repo, len(self.branches) - 1, sha)
+                else:
+                    try:
+                        repo.git.merge_base('--is-ancestor', old, sha)
+                    except git.GitCommandError:
+                        # rewound / force-pushed: reachability may have shrunk
+                        self._rebuild(repo, tips)
+                        return
+                    self._add_commits(repo, self.branches.index(name), sha, f'^{old}')
+                self.tips[name] = sha
+
+    def mask(self, commit_sha: str) -> int:
+        return self.masks.get(commit_sha, 0)
+
+    def branches_containing(self, commit_sha: str) -> list:
+        mask = self.mask(commit_sha)
+        return sorted(name for bit, name in enumerate(self.branches) if mask >> bit & 1)
+
+
+_branch_indexes = {}
+_branch_indexes_lock = threading.Lock()
+
+
+def get_branch_index(repo_path: str) -> BranchIndex:
+    """Return the (refreshed) branch index of a repo, shared across polls."""
+    with _branch_indexes_lock:
+        index = _branch_indexes.get(repo_path)
+        if index is None:
+            index = _branch_indexes[repo_path] = BranchIndex(repo_path)
+    index.refresh()
+    return index
+
+
+def get_commit_other_parents(repo_path: str, commit_sha: str) -> list:
+    """Local branches (other than main) that contain commit_sha."""
+    return get_branch_index(repo_path).branches_containing(commit_sha)
 
 def is_merge_commit(repo_path: str, commit_sha: str) -> bool:
     repo = git.Repo(repo_path)
     commit = repo.commit(commit_sha)
     return len(commit.parents) > 1
 
-def classify_commit(repo_path: str, commit_sha: str) -> dict:
+def classify_commit(repo_path: str, commit_sha: str, known_results: dict = None,
+                    metadata: dict = None) -> dict:
     """
     Return a dict with:
       - classification : "red" | "green" | "refactor" | "unknown"
@@ -103,23 +347,22 @@ def classify_commit(repo_path: str, commit_sha: str) -> dict:
       * tests live under "tests/"
       * prod code is "string_calculator.py"
       * run_tests() and detect_refactoring() are implemented elsewhere.
-    """
-    # 1) Open the repo and locate the commit
-    repo = git.Repo(repo_path)
-    commit = repo.commit(commit_sha)
-
-    # 1) Check out this commit
-    repo.git.checkout(commit.hexsha)
-
-    # 2) Determine which files were modified in this commit
-    if commit.parents:
-        parent = commit.parents[0]
-        diff_entries = commit.diff(parent)
-    else:
-        # Root commit: compare against an empty tree
-        diff_entries = commit.diff(git.NULL_TREE)
 
-    modified_files = [entry.a_path or entry.b_path for entry in diff_entries]
+    known_results optionally maps already-classified commit SHAs to their
+    analysis (e.g. from the player's history), so the parent of a refactor
+    candidate is not tested again. A parent whose run was inconclusive
+    (timeout, pytest error) is not taken as red, and the refactor verdict is
+    then not cached.
+    The result also has 'inconclusive': True if this commit's run was.
+    metadata optionally carries the commit's parents, tree and modified
+    paths (see read_commit_metadata); when given, git is only touched if
+    the tree has to be tested.
+    """
+    # 1) Locate the commit and 2) determine which files were modified in it
+    if metadata is None:
+        metadata = read_commit_metadata(repo_path, commit_sha)
+    modified_files = metadata['paths']
+    parents = metadata['parents']
 
     # 3) Check if tests or production code changed
     TEST_DIR      = "test_"
@@ -127,43 +370,45 @@ def classify_commit(repo_path: str, commit_sha: str) -> dict:
     tests_changed = any(path.startswith(TEST_DIR) for path in modified_files)
     code_changed  = any(path.endswith(PROD_FILENAME) for path in modified_files)
 
-    print(commit.hexsha[:6], tests_changed, code_changed)
-    ntests = count_pytest_tests(repo_path)
+    print(commit_sha[:6], tests_changed, code_changed)
+    # 4) Run the tests at this commit, unless this exact tree was already evaluated
+    tree_sha = metadata['tree']
+    tree_result = evaluate_tree(repo_path, commit_sha, tree_sha)
+    if tree_result.get('timed_out'):
+        # says nothing about the commit; left unclassified
+        return {
+            "commit_classify": 'unknown',
+            "tests_passed":   False,
+            "is_refactoring":    False,
+            "inconclusive":   True,
+            }
+    ntests = tree_result['ntests']
+    tests_passed = tree_result['tests_passed']
     print("Number of tests", ntests)
-    # 4) Run the tests at this commit
-    try:
-        tests_passed = run_tests(repo_path)
-        print("ok", tests_passed)
-    except NotImplementedError:
-        # If run_tests is not implemented, assume unknown
-        tests_passed = False
+    print("ok", tests_passed)
 
- # 4) detect refactoring (only if code changed & tests still pass & no test changes)
+    # 4) detect refactoring (only if code changed & tests still pass & no test changes)
     is_refactor = False
-    if code_changed and tests_passed and not tests_changed and commit.parents:
-        parent = commit.parents[0]
-        old_path = os.path.join(repo_path, "__old_"+PROD_FILENAME)
-        with open(old_path, "wb") as f:
-            f.write((parent.tree / PROD_FILENAME).data_stream.read())
-        new_path = os.path.join(repo_path, PROD_FILENAME)
-        try:
-            is_refactor = detect_refactoring(old_path, new_path)
-        except NotImplementedError:
-            is_refactor = False
-        finally:
-            os.remove(old_path)
-
-
-        repo.git.checkout(commit.parents[0])
-        try:
-            old_tests_passed = run_tests(repo_path)
-        except NotImplementedError:
-            # If run_tests is not implemented, assume unknown
-            old_tests_passed = None
-        is_refactor = is_refactor and old_tests_passed
-    # Check out this commit, again
-    repo.git.checkout(commit.hexsha)
-
+    if code_changed and tests_passed and not tests_changed and parents:
+        parent_sha = parents[0]
+        parent_tree = metadata['parent_tree']
+        cached = get_cached_refactor_result(parent_tree, tree_sha)
+        if cached is not None:
+            is_refactor = cached
+        else:
+            is_refactor = _detect_refactoring_between(repo_path, parent_sha,
+                                                      commit_sha, PROD_FILENAME)
+            parent_result = None
+            if is_refactor:
+                # the parent must have been green too
+                if known_results:
+                    parent_result = known_results.get(parent_sha)
+                if parent_result is None or parent_result.get('inconclusive'):
+                    parent_result = evaluate_tree(repo_path, parent_sha, parent_tree)
+                if not parent_result.get('inconclusive'):
+                    is_refactor = parent_result['tests_passed']
+            if parent_result is None or not parent_result.get('inconclusive'):
+                cache_refactor_result(parent_tree, tree_sha, bool(is_refactor))
 
     # 5) Classify based on the combination of (tests_changed, code_changed, tests_pass)
     if tests_changed and not code_changed and not tests_passed and ntests > 0:
@@ -175,11 +420,14 @@ def classify_commit(repo_path: str, commit_sha: str) -> dict:
     else:
         classification = 'unknown'
 
-    return {
+    result = {
         "commit_classify": classification,
         "tests_passed":   tests_passed,
         "is_refactoring":    is_refactor,
         }
+    if tree_result.get('inconclusive'):
+        result['inconclusive'] = True
+    return result
 
 def classify_commits(repo_path: str) -> dict:
     """
@@ -199,24 +447,34 @@ def classify_commits(repo_path: str) -> dict:
         cls = classify_commit(repo, commit)
         classification[commit.hexsha] = cls
 
-    # (Optionally) check out back to the HEAD of "main" at the end:
-    repo.git.checkout("main")
     print(classification)
     return classification
 
-def find_merge_commits(entries):
-    all_branches = set()
-    # first get all branches
-    for entry in entries:
-        for b in entry['branches']:
-            all_branches.add(b)
-    all_branches = list(all_branches)
+def find_merge_commits(entries, branch_index: BranchIndex = None):
+    """
+    Flag merges in a chronological list of entries: the last entry if it is
+    on some branch (fast-forward merge), and for every branch the latest
+    entry that is on it while the next entry is not.
+
+    Works on one branch bitmask per entry (from branch_index when given,
+    otherwise from the entries' branch names) in a single backwards pass.
+    """
+    if branch_index is not None:
+        masks = [branch_index.mask(entry['commit']) for entry in entries]
+    else:
+        bits = {}
+        masks = []
+        for entry in entries:
+            mask = 0
+            for b in entry['branches']:
+                mask |= 1 << bits.setdefault(b, len(bits))
+            masks.append(mask)
     # last entry (if it contains some branch, it was fast-forward merge)
-    if len(entries[-1]['branches']) > 0:
+    if masks[-1]:
         entries[-1]['is_merge'] = 1
-    for b in all_branches:
-        for i in range(len(entries)-2, 0, -1):
-            if b in entries[i]['branches'] and \
-               b not in entries[i+1]['branches']:
-                entries[i]['is_merge'] = 1
-                break
+    seen = 0
+    for i in range(len(entries)-2, 0, -1):
+        left = masks[i] & ~masks[i+1] & ~seen
+        if left:
+            entries[i]['is_merge'] = 1
+            seen |= left
@@ -1,8 +1,12 @@
 # db.py
 # Redis-backed persistence for TDD-Gitflow Game
 
+import os
+import math
+import time
 import redis
 import json
+import base64
 
 # Initialize Redis client
 redis_client = redis.Redis(host='localhost', port=6379, db=0, decode_responses=True)
@@ -12,7 +16,48 @@ games_key      = 'tddgame:games'
 game_hash      = 'tddgame:game:{game_id}'
 players_set    = 'tddgame:game:{game_id}:players'
 player_hash    = 'tddgame:game:{game_id}:player:{player_id}'
+leaderboard_zset = 'tddgame:game:{game_id}:leaderboard'
+game_events_channel = 'tddgame:game:{game_id}:events'
+game_events_pattern = 'tddgame:game:*:events'
 history_list   = 'tddgame:game:{game_id}:player:{player_id}:history'
+score_state_hash = 'tddgame:game:{game_id}:player:{player_id}:score_state'
+
+# Players by repository, for push webhooks: members are 'game_id/player_id',
+# repo is the lowercased repo_full_name
+repo_players_set = 'tddgame:repo:{repo}:players'
+
+# Push-to-feedback freshness per player (see record_commits_seen)
+commit_times_hash     = 'tddgame:game:{game_id}:player:{player_id}:commit_times'
+pending_feedback_zset = 'tddgame:game:{game_id}:player:{player_id}:pending_feedback'
+feedback_lags_list    = 'tddgame:game:{game_id}:player:{player_id}:feedback_lags'
+# Recent push-to-feedback lags kept per player for the p95
+FRESHNESS_SAMPLES = 100
+# Seconds the commit times and pending commits of a player are kept after
+# its last new commit (drops commits whose feedback never came)
+COMMIT_TIMES_TTL = 7 * 24 * 3600
+
+# LLM feedback jobs (see feedback_queue.py): pending, taken by a worker, given up
+feedback_queue_list      = 'tddgame:feedback:queue'
+feedback_processing_list = 'tddgame:feedback:processing'
+feedback_failed_list     = 'tddgame:feedback:failed'
+# Taken jobs -> {'owner', 'expires'}; a job whose lease expired (its worker
+# died or hung) is put back on the queue by requeue_expired_feedback_jobs
+feedback_leases_hash     = 'tddgame:feedback:leases'
+
+# Token bucket shared by every process calling the LLM (see take_llm_tokens)
+llm_bucket_hash = 'tddgame:llm:bucket'
+
+# Content-addressed classification and LLM feedback cache (shared by all games)
+tree_cache_key     = 'tddgame:cache:tree:{tree_sha}'
+refactor_cache_key = 'tddgame:cache:refactor:{parent_tree}:{tree_sha}'
+feedback_cache_key = 'tddgame:cache:feedback:{digest}'
+cache_lru_zset     = 'tddgame:cache:lru'
+cache_stats_hash   = 'tddgame:cache:stats'
+
+# Eviction: entries expire after CACHE_TTL seconds without a hit, and the
+# least recently used ones are dropped once there are more than CACHE_MAX_ENTRIES.
+CACHE_TTL         = int(os.getenv('TDD_CACHE_TTL', 7 * 24 * 3600))
+CACHE_MAX_ENTRIES = int(os.getenv('TDD_CACHE_MAX_ENTRIES', 50000))
 
 # -----------------------------------------------------------------------------
 # storage for games.
@@ -49,6 +94,23 @@ history_list   = 'tddgame:game:{game_id}:player:{player_id}:history'
 #   ...
 # }
 # -----------------------------------------------------------------------------
+#
+# Versions: game and player hashes carry a 'version' counter that every write
+# below bumps, so the JSON endpoints can answer conditional GETs with 304 Not
+# Modified. A player write bumps its game's version only if it changes what
+# the game-level endpoints show (the leaderboard: membership, names, scores).
+# -----------------------------------------------------------------------------
+
+# Player fields shown on the leaderboard
+LEADERBOARD_FIELDS = ('name', 'score')
+
+
+def _bump_versions(pipe, game_id: str, player_id: str = None, game: bool = True):
+    """Queue version increments for a game and/or one of its players on pipe."""
+    if player_id is not None:
+        pipe.hincrby(player_hash.format(game_id=game_id, player_id=player_id), 'version', 1)
+    if game:
+        pipe.hincrby(game_hash.format(game_id=game_id), 'version', 1)
 
 # ------------------- Game-level operations -------------------
 def list_games():
@@ -72,15 +134,50 @@ def get_game(game_id: str) -> dict:
         return None
     return game
 
+def get_games_bulk(game_ids: list) -> dict:
+    """Retrieve metadata of several games in one round trip: {game_id: game or None}."""
+    pipe = redis_client.pipeline(transaction=False)
+    for gid in game_ids:
+        pipe.hgetall(game_hash.format(game_id=gid))
+    return {gid: (game or None) for gid, game in zip(game_ids, pipe.execute())}
+
+
+def load_game_summary(game_id: str) -> dict:
+    """
+    Game metadata plus every player's hash under 'players' (no histories),
+    in two round trips. Returns None if the game does not exist.
+    """
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hgetall(game_hash.format(game_id=game_id))
+    pipe.smembers(players_set.format(game_id=game_id))
+    game, pids = pipe.execute()
+    if not game:
+        return None
+    game['players'] = get_players_bulk(game_id, list(pids))
+    return game
+
+
 def load_game_with_histories(game_id):
-    game = get_game(game_id)
+    """Like load_game_summary, with each player's full 'history' (two round trips)."""
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hgetall(game_hash.format(game_id=game_id))
+    pipe.smembers(players_set.format(game_id=game_id))
+    game, pids = pipe.execute()
     if not game:
         return None
 
+    pids = list(pids)
+    pipe = redis_client.pipeline(transaction=False)
+    for pid in pids:
+        pipe.hgetall(player_hash.format(game_id=game_id, player_id=pid))
+        pipe.lrange(history_list.format(game_id=game_id, player_id=pid), 0, -1)
+    results = pipe.execute()
+
     players = {}
-    for pid in list_players(game_id):
-        pdata = get_player(game_id, pid)
-        pdata['history'] = get_history(game_id, pid)
+    for pid, pdata, raw in zip(pids, results[0::2], results[1::2]):
+        if not pdata:
+            continue
+        pdata['history'] = [_decode_history_entry(item) for item in raw]
         players[pid] = pdata
 
     game['players'] = players
@@ -88,10 +185,13 @@ def load_game_with_histories(game_id):
 
 def update_game_status(game_id: str, status: str):
     """Set a game's status (running, paused, stopped)."""
-    redis_client.hset(
+    pipe = redis_client.pipeline()
+    pipe.hset(
         game_hash.format(game_id=game_id),
         'status', status
     )
+    _bump_versions(pipe, game_id)
+    pipe.execute()
 
 # ------------------- Player-level operations -------------------
 def list_players(game_id: str) -> list:
@@ -105,8 +205,9 @@ def create_player_entry(game_id: str, player_id: str, data: dict):
       - name, repo_full_name, score, latest_feedback, last_commit
     """
     print("PLAYER:", data)
-    redis_client.sadd(players_set.format(game_id=game_id), player_id)
-    redis_client.hset(
+    pipe = redis_client.pipeline()
+    pipe.sadd(players_set.format(game_id=game_id), player_id)
+    pipe.hset(
         player_hash.format(game_id=game_id, player_id=player_id),
         mapping={
             'name': data['name'],
@@ -118,6 +219,12 @@ def create_player_entry(game_id: str, player_id: str, data: dict):
             "repo_path": data.get('repo_path', '')
         }
     )
+    pipe.zadd(leaderboard_zset.format(game_id=game_id),
+              {player_id: float(data.get('score', 0))})
+    pipe.sadd(repo_players_set.format(repo=data['repo_full_name'].lower()),
+              f'{game_id}/{player_id}')
+    _bump_versions(pipe, game_id, player_id)
+    pipe.execute()
 
 
 def get_player(game_id: str, player_id: str) -> dict:
@@ -129,33 +236,369 @@ def get_player(game_id: str, player_id: str) -> dict:
 
 
 
+def get_players_bulk(game_id: str, player_ids: list = None) -> dict:
+    """
+    Retrieve several players' metadata in one round trip (two if player_ids
+    is None, which means every player of the game): {player_id: data}.
+    Players that no longer exist are left out.
+    """
+    if player_ids is None:
+        player_ids = list_players(game_id)
+    pipe = redis_client.pipeline(transaction=False)
+    for pid in player_ids:
+        pipe.hgetall(player_hash.format(game_id=game_id, player_id=pid))
+    return {pid: pdata for pid, pdata in zip(player_ids, pipe.execute()) if pdata}
+
+
+def find_repo_players(repo_full_name: str) -> list:
+    """(game_id, player_id) of every player registered with this repository."""
+    members = redis_client.smembers(repo_players_set.format(repo=repo_full_name.lower()))
+    return [tuple(member.split('/', 1)) for member in members]
+
+
+def index_repo_players() -> int:
+    """
+    Add every existing player to the repository index (players created before
+    the index existed). Idempotent; returns the number of players indexed.
+    """
+    count = 0
+    for game_id in list_games():
+        players = get_players_bulk(game_id)
+        pipe = redis_client.pipeline(transaction=False)
+        for player_id, data in players.items():
+            pipe.sadd(repo_players_set.format(repo=data['repo_full_name'].lower()),
+                      f'{game_id}/{player_id}')
+        pipe.execute()
+        count += len(players)
+    return count
+
+
+def get_game_and_player(game_id: str, player_id: str):
+    """Retrieve (game, player) metadata in one round trip; either may be None."""
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hgetall(game_hash.format(game_id=game_id))
+    pipe.hgetall(player_hash.format(game_id=game_id, player_id=player_id))
+    game, player = pipe.execute()
+    return (game or None, player or None)
+
+
 def update_player_field(game_id: str, player_id: str, field: str, value):
-    """Update a single field in a player's hash."""
-    redis_client.hset(
+    """
+    Update a single field in a player's hash.
+    A new 'score' is written to the game's leaderboard in the same transaction.
+    """
+    pipe = redis_client.pipeline()
+    pipe.hset(
         player_hash.format(game_id=game_id, player_id=player_id),
         field, value
     )
+    if field == 'score':
+        pipe.zadd(leaderboard_zset.format(game_id=game_id), {player_id: float(value)})
+    _bump_versions(pipe, game_id, player_id, game=field in LEADERBOARD_FIELDS)
+    pipe.execute()
+
+def set_latest_feedback(game_id: str, player_id: str, upto: int, feedback: str) -> bool:
+    """
+    Store feedback on the history entries before index `upto` as the
+    player's latest_feedback, unless feedback on later entries is already
+    there (feedback jobs finish in any order). Returns whether it was stored.
+    """
+    key = player_hash.format(game_id=game_id, player_id=player_id)
+    while True:
+        with redis_client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                if int(pipe.hget(key, 'feedback_upto') or 0) > upto:
+                    return False
+                pipe.multi()
+                pipe.hset(key, mapping={'latest_feedback': feedback, 'feedback_upto': upto})
+                _bump_versions(pipe, game_id, player_id, game=False)
+                pipe.execute()
+                return True
+            except redis.WatchError:
+                continue
+
+# ------------------- Game events (pub/sub) -------------------
+def publish_game_event(game_id: str, event: str, data: dict):
+    """
+    Publish a change ('score', 'leaderboard', 'feedback', 'status') to the
+    game's event channel; events.py fans it out to SSE clients.
+    """
+    redis_client.publish(game_events_channel.format(game_id=game_id),
+                         json.dumps({'event': event, 'data': data}))
+
+# ------------------- Leaderboard operations -------------------
+# Each game keeps a sorted set player_id -> score, so rankings are served
+# straight from Redis instead of loading and sorting every player.
+def rebuild_leaderboard(game_id: str):
+    """(Re)create a game's leaderboard from its players' hashes."""
+    players = get_players_bulk(game_id)
+    key = leaderboard_zset.format(game_id=game_id)
+    pipe = redis_client.pipeline()
+    pipe.delete(key)
+    if players:
+        pipe.zadd(key, {pid: float(p.get('score', 0)) for pid, p in players.items()})
+    pipe.execute()
+
+
+def get_leaderboard(game_id: str, start: int = 0, stop: int = -1) -> list:
+    """
+    Ranked slice [start, stop] (inclusive, best first) of a game's leaderboard:
+    a list of {'id', 'name', 'score', 'rank'} with 0-based ranks.
+    """
+    key = leaderboard_zset.format(game_id=game_id)
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.zrevrange(key, start, stop, withscores=True)
+    pipe.exists(key)
+    pipe.scard(players_set.format(game_id=game_id))
+    entries, exists, nplayers = pipe.execute()
+    if not exists and nplayers:
+        # game created before leaderboards existed
+        rebuild_leaderboard(game_id)
+        entries = redis_client.zrevrange(key, start, stop, withscores=True)
+
+    pipe = redis_client.pipeline(transaction=False)
+    for pid, _ in entries:
+        pipe.hget(player_hash.format(game_id=game_id, player_id=pid), 'name')
+    names = pipe.execute()
+    first = start if start >= 0 else max(0, redis_client.zcard(key) + start)
+    return [{'id': pid, 'name': name, 'score': score, 'rank': first + i}
+            for i, ((pid, score), name) in enumerate(zip(entries, names))]
+
+
+def get_player_rank(game_id: str, player_id: str) -> dict:
+    """{'rank' (0-based), 'score', 'total'} for a player, or None if not ranked."""
+    key = leaderboard_zset.format(game_id=game_id)
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.zrevrank(key, player_id)
+    pipe.zscore(key, player_id)
+    pipe.zcard(key)
+    rank, score, total = pipe.execute()
+    if rank is None:
+        return None
+    return {'rank': rank, 'score': score, 'total': total}
+
+
+def get_leaderboard_around(game_id: str, player_id: str, radius: int = 2) -> list:
+    """The leaderboard window of up to `radius` players above and below player_id."""
+    rank = redis_client.zrevrank(leaderboard_zset.format(game_id=game_id), player_id)
+    if rank is None:
+        return []
+    return get_leaderboard(game_id, max(0, rank - radius), rank + radius)
 
 # ------------------- Commit history operations -------------------
+# History entries are stored as compact, versioned JSON arrays instead of the
+# dicts the API hands out:
+#   [2, sha, classify, flags, branches, num_merges, bad_in_row, feedback, extra?]
+#   sha      : the 20 raw SHA bytes, base64 without padding (27 chars)
+#   classify : index into HISTORY_CLASSIFY (the string itself if unknown)
+#   flags    : bit 0 tests_passed, bit 1 is_refactoring, bit 2 is_merge
+#   extra    : any other entry keys (other analysis keys under 'analysis')
+# Entries written before this format (plain JSON dicts) are still read as is;
+# migrate_history_entries() converts them in place.
+HISTORY_ENTRY_VERSION = 2
+HISTORY_CLASSIFY = ['unknown', 'red', 'green', 'refactor', 'merge']
+_HISTORY_FLAGS = (('tests_passed', 1), ('is_refactoring', 2))
+_HISTORY_MERGE_FLAG = 4
+_history_keys = {'commit', 'branches', 'feedback', 'analysis', 'is_merge',
+                 'num_merges', 'bad_in_row'}
+_analysis_keys = {'commit_classify', 'tests_passed', 'is_refactoring'}
+
+
+def _pack_sha(sha: str) -> str:
+    if len(sha) == 40:
+        try:
+            return base64.b64encode(bytes.fromhex(sha)).decode()[:-1]
+        except ValueError:
+            pass
+    return sha
+
+
+def _unpack_sha(packed: str) -> str:
+    if len(packed) == 27:
+        return base64.b64decode(packed + '=').hex()
+    return packed
+
+
+def _encode_history_entry(entry: dict) -> str:
+    """Serialize a history entry dict to the compact format above."""
+    analysis = entry.get('analysis') or {}
+    classify = analysis.get('commit_classify', 'unknown')
+    flags = 0
+    for key, bit in _HISTORY_FLAGS:
+        if analysis.get(key):
+            flags |= bit
+    if entry.get('is_merge'):
+        flags |= _HISTORY_MERGE_FLAG
+    row = [
+        HISTORY_ENTRY_VERSION,
+        _pack_sha(entry.get('commit') or ''),
+        HISTORY_CLASSIFY.index(classify) if classify in HISTORY_CLASSIFY else classify,
+        flags,
+        entry.get('branches', []),
+        entry.get('num_merges'),
+        entry.get('bad_in_row'),
+        entry.get('feedback', ''),
+    ]
+    extra = {k: v for k, v in entry.items() if k not in _history_keys}
+    extra_analysis = {k: v for k, v in analysis.items() if k not in _analysis_keys}
+    if extra_analysis:
+        extra['analysis'] = extra_analysis
+    if extra:
+        row.append(extra)
+    return json.dumps(row, separators=(',', ':'), ensure_ascii=False)
+
+
+def _decode_history_entry(raw: str) -> dict:
+    """Parse a stored history entry (compact or legacy JSON dict) into a dict."""
+    row = json.loads(raw)
+    if isinstance(row, dict):
+        return row
+    _, sha, classify, flags, branches, num_merges, bad_in_row, feedback = row[:8]
+    extra = row[8] if len(row) > 8 else {}
+    analysis = {
+        'commit_classify': HISTORY_CLASSIFY[classify] if isinstance(classify, int) else classify,
+    }
+    for key, bit in _HISTORY_FLAGS:
+        analysis[key] = bool(flags & bit)
+    analysis.update(extra.pop('analysis', {}))
+    entry = {
+        'commit':   _unpack_sha(sha),
+        'branches': branches,
+        'feedback': feedback,
+        'analysis': analysis,
+        'is_merge': bool(flags & _HISTORY_MERGE_FLAG),
+    }
+    if num_merges is not None:
+        entry['num_merges'] = num_merges
+    if bad_in_row is not None:
+        entry['bad_in_row'] = bad_in_row
+    entry.update(extra)
+    return entry
+
+
+def migrate_history_entries() -> int:
+    """
+    One-shot conversion of every stored history list to the compact entry
+    format, in place. Each list is rewritten in a WATCHed transaction, so a
+    concurrent append makes it retry instead of losing the entry.
+    Returns the number of entries converted.
+    """
+    converted = 0
+    for key in redis_client.scan_iter(match=history_list.format(game_id='*', player_id='*')):
+        while True:
+            with redis_client.pipeline() as pipe:
+                try:
+                    pipe.watch(key)
+                    raw = pipe.lrange(key, 0, -1)
+                    legacy = sum(1 for item in raw if item.startswith('{'))
+                    if not legacy:
+                        break
+                    pipe.multi()
+                    pipe.delete(key)
+                    pipe.rpush(key, *[_encode_history_entry(_decode_history_entry(item))
+                                      for item in raw])
+                    pipe.execute()
+                    converted += legacy
+                    break
+                except redis.WatchError:
+                    continue
+    return converted
+
+
 def reset_player(game_id: str, player_id: str):
     redis_client.delete(history_list.format(game_id=game_id, player_id=player_id))
+    redis_client.delete(score_state_hash.format(game_id=game_id, player_id=player_id))
+    redis_client.delete(*[key.format(game_id=game_id, player_id=player_id)
+                          for key in (commit_times_hash, pending_feedback_zset,
+                                      feedback_lags_list)])
 
     # Reset their metadata fields
     update_player_field(game_id, player_id, 'last_commit', '')
     update_player_field(game_id, player_id, 'score', 0)
     update_player_field(game_id, player_id, 'latest_feedback', '')
+    update_player_field(game_id, player_id, 'feedback_upto', 0)
     # Also clear the paused flag
     update_player_field(game_id, player_id, 'paused', 0)
 
-def append_history_entry(game_id: str, player_id: str, entry: dict):
+def append_history_entry(game_id: str, player_id: str, entry: dict) -> int:
     """
     Append a commit entry to a player's history list.
-    Entry is a dict; it will be JSON-serialized.
+    Entry is a dict; it is stored in the compact format above.
+    Returns the new history length (the entry's index + 1).
     """
-    redis_client.rpush(
+    pipe = redis_client.pipeline()
+    pipe.rpush(
         history_list.format(game_id=game_id, player_id=player_id),
-        json.dumps(entry)
+        _encode_history_entry(entry)
     )
+    _bump_versions(pipe, game_id, player_id, game=False)
+    return pipe.execute()[0]
+
+
+def store_new_commits(game_id: str, player_id: str, entries: list, score_state: dict,
+                      score: float, last_commit: str) -> int:
+    """
+    Record one poll's newly processed commits in a single transaction: append
+    the entries, store the running score state and score, advance
+    last_commit and queue the LLM feedback job for the entries. Either all of
+    it lands or none of it does, so a failed write leaves the commits to be
+    picked up again by the next poll. Returns the index of the first entry.
+    """
+    key = history_list.format(game_id=game_id, player_id=player_id)
+    while True:
+        with redis_client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                start = pipe.llen(key)
+                pipe.multi()
+                pipe.rpush(key, *[_encode_history_entry(entry) for entry in entries])
+                pipe.hset(score_state_hash.format(game_id=game_id, player_id=player_id),
+                          mapping=_score_state_mapping(score_state))
+                pipe.hset(player_hash.format(game_id=game_id, player_id=player_id),
+                          mapping={'last_commit': last_commit, 'score': score})
+                pipe.zadd(leaderboard_zset.format(game_id=game_id), {player_id: float(score)})
+                pipe.lpush(feedback_queue_list, json.dumps({
+                    'game_id':   game_id,
+                    'player_id': player_id,
+                    'start':     start,
+                    'commits':   [entry['commit'] for entry in entries],
+                    'attempts':  0,
+                }))
+                _bump_versions(pipe, game_id, player_id)
+                pipe.execute()
+                return start
+            except redis.WatchError:
+                continue
+
+
+def set_history_feedback(game_id: str, player_id: str, start: int, feedback: dict) -> int:
+    """
+    Patch 'feedback' into stored entries from index `start` on, where
+    feedback maps commit SHA -> text. Entries whose SHA does not match (the
+    history was reset meanwhile) are left alone. Returns the number patched.
+    """
+    key = history_list.format(game_id=game_id, player_id=player_id)
+    while True:
+        with redis_client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                raw = pipe.lrange(key, start, start + len(feedback) - 1)
+                patched = {}
+                for i, item in enumerate(raw):
+                    entry = _decode_history_entry(item)
+                    if entry['commit'] in feedback:
+                        entry['feedback'] = feedback[entry['commit']]
+                        patched[start + i] = _encode_history_entry(entry)
+                pipe.multi()
+                for index, item in patched.items():
+                    pipe.lset(key, index, item)
+                if patched:
+                    _bump_versions(pipe, game_id, player_id, game=False)
+                pipe.execute()
+                return len(patched)
+            except redis.WatchError:
+                continue
 
 
 def get_history(game_id: str, player_id: str) -> list:
@@ -164,7 +607,349 @@ def get_history(game_id: str, player_id: str) -> list:
         history_list.format(game_id=game_id, player_id=player_id),
         0, -1
     )
-    return [json.loads(item) for item in raw]
+    return [_decode_history_entry(item) for item in raw]
+
+
+def get_history_length(game_id: str, player_id: str) -> int:
+    return redis_client.llen(history_list.format(game_id=game_id, player_id=player_id))
+
+
+def get_history_page(game_id: str, player_id: str, page: int = 1, limit: int = 50) -> dict:
+    """
+    One page of a player's history, newest page first (page 1 = the last
+    `limit` entries), in one round trip:
+      { 'entries': [...] (chronological), 'start': index of the first entry,
+        'total': history length }
+    """
+    key = history_list.format(game_id=game_id, player_id=player_id)
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.llen(key)
+    pipe.lrange(key, -page * limit, -(page - 1) * limit - 1)
+    total, raw = pipe.execute()
+    return {
+        'entries': [_decode_history_entry(item) for item in raw],
+        'start':   max(0, total - page * limit),
+        'total':   total,
+    }
+
+
+def get_history_since(game_id: str, player_id: str, since: int, limit: int = None) -> dict:
+    """
+    History entries from index `since` on (at most `limit`), i.e. what a
+    client that already has the first `since` entries has not seen yet.
+    Same shape as get_history_page.
+    """
+    key = history_list.format(game_id=game_id, player_id=player_id)
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.llen(key)
+    pipe.lrange(key, since, since + limit - 1 if limit else -1)
+    total, raw = pipe.execute()
+    return {
+        'entries': [_decode_history_entry(item) for item in raw],
+        'start':   since,
+        'total':   total,
+    }
+
+
+def get_history_tail(game_id: str, player_id: str, count: int) -> list:
+    """Load the last `count` commit entries of a player's history."""
+    raw = redis_client.lrange(
+        history_list.format(game_id=game_id, player_id=player_id),
+        -count, -1
+    )
+    return [_decode_history_entry(item) for item in raw]
+
+# ------------------- Push-to-feedback freshness -------------------
+# Per commit the poller records [committed_at, seen_at, classified_at]
+# (commit timestamp, fetch time, classification time) in commit_times until
+# its feedback is written. Commits without feedback yet are in the pending
+# zset, scored by seen_at; feedback_lags keeps the last FRESHNESS_SAMPLES
+# seen -> feedback lags.
+def record_commits_seen(game_id: str, player_id: str, times: dict):
+    """times: {sha: (committed_at, seen_at, classified_at)} of newly processed commits."""
+    if not times:
+        return
+    times_key = commit_times_hash.format(game_id=game_id, player_id=player_id)
+    pipe = redis_client.pipeline()
+    pipe.hset(times_key, mapping={sha: json.dumps(list(t)) for sha, t in times.items()})
+    pipe.expire(times_key, COMMIT_TIMES_TTL)
+    pending_key = pending_feedback_zset.format(game_id=game_id, player_id=player_id)
+    pipe.zadd(pending_key, {sha: t[1] for sha, t in times.items()})
+    pipe.expire(pending_key, COMMIT_TIMES_TTL)
+    pipe.execute()
+
+
+def record_feedback_written(game_id: str, player_id: str, shas: list):
+    """Keep the seen -> feedback lags of shas and drop them from commit_times and pending."""
+    times_key = commit_times_hash.format(game_id=game_id, player_id=player_id)
+    now = time.time()
+    raw = redis_client.hmget(times_key, shas)
+    lags = [now - json.loads(item)[1] for item in raw if item is not None]
+    pipe = redis_client.pipeline()
+    pipe.hdel(times_key, *shas)
+    pipe.zrem(pending_feedback_zset.format(game_id=game_id, player_id=player_id), *shas)
+    if lags:
+        lags_key = feedback_lags_list.format(game_id=game_id, player_id=player_id)
+        pipe.lpush(lags_key, *[round(lag, 3) for lag in lags])
+        pipe.ltrim(lags_key, 0, FRESHNESS_SAMPLES - 1)
+    pipe.execute()
+
+
+def get_freshness_bulk(game_id: str, player_ids: list) -> dict:
+    """
+    {player_id: {'pending', 'lag', 'p95_lag', 'last_lag'}} in one round trip:
+    pending commits without feedback, seconds since the oldest of them was
+    first seen (0 if none), and the p95 / latest of the recent seen -> feedback lags.
+    """
+    pipe = redis_client.pipeline(transaction=False)
+    for pid in player_ids:
+        pending_key = pending_feedback_zset.format(game_id=game_id, player_id=pid)
+        pipe.zcard(pending_key)
+        pipe.zrange(pending_key, 0, 0, withscores=True)
+        pipe.lrange(feedback_lags_list.format(game_id=game_id, player_id=pid), 0, -1)
+    results = pipe.execute()
+    now = time.time()
+    freshness = {}
+    for n, pid in enumerate(player_ids):
+        pending, oldest, lags = results[3 * n: 3 * n + 3]
+        lags = [float(lag) for lag in lags]
+        ordered = sorted(lags)
+        freshness[pid] = {
+            'pending':  pending,
+            'lag':      now - oldest[0][1] if oldest else 0.0,
+            'p95_lag':  ordered[math.ceil(0.95 * len(ordered)) - 1] if ordered else None,
+            'last_lag': lags[0] if lags else None,
+        }
+    return freshness
+
+# ------------------- Feedback job queue -------------------
+# A reliable queue: a worker atomically moves a job from the queue to the
+# processing list and removes it from there once done. While it works on the
+# job it holds a lease on it, renewed by a heartbeat, so jobs of a worker
+# that died are still in Redis and go back to the queue once their lease
+# expires, while jobs of live workers in other processes are left alone.
+# Jobs are pushed by store_new_commits, with the commits they cover.
+def _lease(owner: str, seconds: float) -> str:
+    return json.dumps({'owner': owner, 'expires': time.time() + seconds})
+
+
+def take_feedback_job(owner: str, lease: float, timeout: int = 5):
+    """
+    Block up to `timeout` seconds for a job and lease it to owner for
+    `lease` seconds; returns (raw, job) or None.
+    """
+    raw = redis_client.brpoplpush(feedback_queue_list, feedback_processing_list, timeout)
+    if raw is None:
+        return None
+    redis_client.hset(feedback_leases_hash, raw, _lease(owner, lease))
+    return raw, json.loads(raw)
+
+
+def renew_feedback_leases(raws: list, owner: str, lease: float):
+    """Extend the leases of the jobs owner is still working on."""
+    if raws:
+        redis_client.hset(feedback_leases_hash,
+                          mapping={raw: _lease(owner, lease) for raw in raws})
+
+
+def finish_feedback_job(raw: str, retry: dict = None, failed: bool = False):
+    """
+    Drop a taken job from the processing list; with `retry` queue that job
+    again, with failed=True keep it in the failed list for inspection.
+    """
+    pipe = redis_client.pipeline()
+    pipe.lrem(feedback_processing_list, 1, raw)
+    pipe.hdel(feedback_leases_hash, raw)
+    if retry is not None:
+        pipe.lpush(feedback_queue_list, json.dumps(retry))
+    elif failed:
+        pipe.lpush(feedback_failed_list, raw)
+    pipe.execute()
+
+
+def requeue_expired_feedback_jobs(lease: float) -> int:
+    """
+    Move taken jobs whose lease expired back to the queue. A job without a
+    lease (taken a moment ago, or its worker died right after taking it) is
+    given one of `lease` seconds first. Returns the number of jobs moved.
+    """
+    while True:
+        with redis_client.pipeline() as pipe:
+            try:
+                pipe.watch(feedback_processing_list, feedback_leases_hash)
+                taken = pipe.lrange(feedback_processing_list, 0, -1)
+                leases = pipe.hgetall(feedback_leases_hash)
+                now = time.time()
+                pipe.multi()
+                moved = 0
+                for raw in set(taken):
+                    if raw not in leases:
+                        pipe.hset(feedback_leases_hash, raw, _lease('', lease))
+                    elif json.loads(leases[raw])['expires'] < now:
+                        pipe.lrem(feedback_processing_list, 1, raw)
+                        pipe.hdel(feedback_leases_hash, raw)
+                        pipe.lpush(feedback_queue_list, raw)
+                        moved += 1
+                # leases of jobs no longer taken (finished after being reclaimed)
+                stale = [raw for raw in leases if raw not in taken]
+                if stale:
+                    pipe.hdel(feedback_leases_hash, *stale)
+                pipe.execute()
+                return moved
+            except redis.WatchError:
+                continue
+
+
+def get_feedback_queue_stats() -> dict:
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.llen(feedback_queue_list)
+    pipe.llen(feedback_processing_list)
+    pipe.llen(feedback_failed_list)
+    queued, processing, failed = pipe.execute()
+    return {'queued': queued, 'processing': processing, 'failed': failed}
+
+# ------------------- LLM rate limiting -------------------
+# One token bucket in Redis, updated atomically by Lua scripts on Redis
+# server time, so all feedback workers of all processes share the budget.
+# 'blocked_until' holds everyone back after the service answered 429.
+_TAKE_TOKENS_LUA = """
+local now = redis.call('TIME')
+now = tonumber(now[1]) + tonumber(now[2]) / 1000000
+local rate, capacity = tonumber(ARGV[1]), tonumber(ARGV[2])
+local wanted = math.min(tonumber(ARGV[3]), capacity)
+local b = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'blocked_until')
+local blocked = tonumber(b[3]) or 0
+if blocked > now then
+    return tostring(blocked - now)
+end
+local tokens = math.min(capacity, (tonumber(b[1]) or capacity) + (now - (tonumber(b[2]) or now)) * rate)
+local wait = 0
+if tokens >= wanted then
+    tokens = tokens - wanted
+else
+    wait = (wanted - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], 3600)
+return tostring(wait)
+"""
+_BLOCK_LUA = """
+local now = redis.call('TIME')
+local until_ = tonumber(now[1]) + tonumber(now[2]) / 1000000 + tonumber(ARGV[1])
+local blocked = tonumber(redis.call('HGET', KEYS[1], 'blocked_until')) or 0
+if until_ > blocked then
+    redis.call('HSET', KEYS[1], 'blocked_until', until_)
+    redis.call('EXPIRE', KEYS[1], 3600)
+end
+return 1
+"""
+_take_tokens_script = redis_client.register_script(_TAKE_TOKENS_LUA)
+_block_script = redis_client.register_script(_BLOCK_LUA)
+
+
+def take_llm_tokens(tokens: int, per_minute: int) -> float:
+    """
+    Try to take `tokens` from the shared LLM budget of `per_minute` tokens.
+    Returns 0 if granted, otherwise the seconds to wait before trying again.
+    """
+    return float(_take_tokens_script(keys=[llm_bucket_hash],
+                                     args=[per_minute / 60.0, per_minute, tokens]))
+
+
+def block_llm_requests(seconds: float):
+    """Make every take_llm_tokens caller wait at least `seconds` (e.g. after a 429)."""
+    _block_script(keys=[llm_bucket_hash], args=[seconds])
+
+# ------------------- Running score state -------------------
+def get_score_state(game_id: str, player_id: str) -> dict:
+    """
+    Load a player's running score aggregates (see score.new_score_state),
+    or None if they were never stored.
+    """
+    raw = redis_client.hgetall(score_state_hash.format(game_id=game_id, player_id=player_id))
+    if raw == {}:
+        return None
+    return {
+        'count':         int(raw['count']),
+        'merges':        int(raw['merges']),
+        'unknown_run':   int(raw['unknown_run']),
+        'prev_classify': raw['prev_classify'],
+        'total':         float(raw['total']),
+    }
+
+
+def _score_state_mapping(state: dict) -> dict:
+    return {
+        'count':         state['count'],
+        'merges':        state['merges'],
+        'unknown_run':   state['unknown_run'],
+        'prev_classify': state['prev_classify'],
+        'total':         repr(float(state['total'])),
+    }
+
+# ------------------- Classification cache operations -------------------
+def _cache_get(key: str, kind: str):
+    """Look up a cache entry, refreshing its TTL/LRU rank and counting the hit or miss."""
+    raw = redis_client.get(key)
+    pipe = redis_client.pipeline()
+    if raw is None:
+        pipe.hincrby(cache_stats_hash, f'{kind}_misses', 1)
+    else:
+        pipe.hincrby(cache_stats_hash, f'{kind}_hits', 1)
+        pipe.expire(key, CACHE_TTL)
+        pipe.zadd(cache_lru_zset, {key: time.time()})
+    pipe.execute()
+    return None if raw is None else json.loads(raw)
+
+
+def _cache_set(key: str, value):
+    """Store a cache entry and evict the least recently used ones above the size bound."""
+    pipe = redis_client.pipeline()
+    pipe.set(key, json.dumps(value), ex=CACHE_TTL)
+    pipe.zadd(cache_lru_zset, {key: time.time()})
+    pipe.zcard(cache_lru_zset)
+    size = pipe.execute()[-1]
+    if size > CACHE_MAX_ENTRIES:
+        evicted = redis_client.zpopmin(cache_lru_zset, size - CACHE_MAX_ENTRIES)
+        if evicted:
+            redis_client.delete(*[k for k, _ in evicted])
+            redis_client.hincrby(cache_stats_hash, 'evictions', len(evicted))
+
+
+def get_cached_tree_result(tree_sha: str) -> dict:
+    """Return {'tests_passed', 'ntests'} for a source tree, or None if not cached."""
+    return _cache_get(tree_cache_key.format(tree_sha=tree_sha), 'tree')
+
+
+def cache_tree_result(tree_sha: str, result: dict):
+    _cache_set(tree_cache_key.format(tree_sha=tree_sha), result)
+
+
+def get_cached_refactor_result(parent_tree: str, tree_sha: str):
+    """Return the refactor verdict (bool) for parent_tree -> tree_sha, or None if not cached."""
+    return _cache_get(refactor_cache_key.format(parent_tree=parent_tree,
+                                                tree_sha=tree_sha), 'refactor')
+
+
+def cache_refactor_result(parent_tree: str, tree_sha: str, is_refactor: bool):
+    _cache_set(refactor_cache_key.format(parent_tree=parent_tree,
+                                         tree_sha=tree_sha), is_refactor)
+
+
+def get_cached_feedback(digest: str):
+    """Return cached LLM feedback (str) for an entry/batch digest, or None."""
+    return _cache_get(feedback_cache_key.format(digest=digest), 'feedback')
+
+
+def cache_feedback(digest: str, feedback: str):
+    _cache_set(feedback_cache_key.format(digest=digest), feedback)
+
+
+def get_cache_stats() -> dict:
+    """Hit/miss/eviction counters and current size of the classification/feedback cache."""
+    stats = {k: int(v) for k, v in redis_client.hgetall(cache_stats_hash).items()}
+    stats['size'] = redis_client.zcard(cache_lru_zset)
+    return stats
 
 # ------------------- some data for debugging -----
 
@@ -220,3 +1005,7 @@ def populate_db():
 
 
 #games = {}
+
+if __name__ == '__main__':
+    # one-shot migration of history lists to the compact entry format
+    print(f'converted {migrate_history_entries()} history entries')
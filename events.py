@@ -0,0 +1,101 @@
+# events.py
+# Server-Sent Events fan-out for score, leaderboard and feedback updates.
+#
+# The poller publishes game events on a Redis channel per game
+# (db.publish_game_event). Each web process runs a single pub/sub
+# subscriber thread that hands every event to the queues of the SSE
+# clients watching that game, so open dashboards are pushed changes
+# instead of polling the JSON endpoints.
+
+import json
+import queue
+import threading
+import time
+
+from db import redis_client, game_events_pattern
+
+# Seconds between keep-alive comments on an idle stream
+KEEPALIVE_INTERVAL = 15
+# Events buffered per client before a slow client starts dropping them
+CLIENT_QUEUE_SIZE = 100
+
+
+class GameEventBroker:
+    """One Redis subscriber per process, fanning game events out to client queues."""
+
+    def __init__(self):
+        self._clients = {}     # game_id -> set of queue.Queue
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _ensure_listening(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._listen, daemon=True)
+                self._thread.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(game_events_pattern)
+                for message in pubsub.listen():
+                    # channel is tddgame:game:<game_id>:events
+                    game_id = message['channel'].split(':')[2]
+                    self._dispatch(game_id, message['data'])
+            except Exception as e:
+                print(f"Event subscriber error ({e}), reconnecting")
+                time.sleep(1)
+
+    def _dispatch(self, game_id: str, raw: str):
+        with self._lock:
+            clients = list(self._clients.get(game_id, ()))
+        for q in clients:
+            try:
+                q.put_nowait(raw)
+            except queue.Full:
+                pass
+
+    def subscribe(self, game_id: str) -> queue.Queue:
+        self._ensure_listening()
+        q = queue.Queue(maxsize=CLIENT_QUEUE_SIZE)
+        with self._lock:
+            self._clients.setdefault(game_id, set()).add(q)
+        return q
+
+    def unsubscribe(self, game_id: str, q: queue.Queue):
+        with self._lock:
+            clients = self._clients.get(game_id)
+            if clients is not None:
+                clients.discard(q)
+                if not clients:
+                    del self._clients[game_id]
+
+    def client_count(self) -> int:
+        with self._lock:
+            return sum(len(c) for c in self._clients.values())
+
+    def stream(self, game_id: str, player_id: str = None):
+        """
+        Generator of SSE frames for a game. With player_id, per-player events
+        ('score', 'feedback') of other players are filtered out.
+        """
+        q = self.subscribe(game_id)
+        try:
+            yield "retry: 5000\n\n"
+            while True:
+                try:
+                    raw = q.get(timeout=KEEPALIVE_INTERVAL)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                event = json.loads(raw)
+                data = event['data']
+                if player_id and 'player_id' in data and data['player_id'] != player_id:
+                    continue
+                yield f"event: {event['event']}\ndata: {json.dumps(data)}\n\n"
+        finally:
+            self.unsubscribe(game_id, q)
+
+
+broker = GameEventBroker()
@@ -0,0 +1,183 @@
+# feedback_queue.py
+# Asynchronous LLM feedback for processed commits.
+#
+# The poller classifies, scores and stores new commits right away and only
+# queues a feedback job (db.store_new_commits) for them:
+#   { 'game_id', 'player_id', 'start': index of the first new entry,
+#     'commits': [sha, ...], 'attempts': n }
+# Worker threads take jobs from the Redis queue, ask the LLM, patch the
+# per-commit feedback into the stored entries, update the player's
+# latest_feedback (unless a job on later commits already did) and publish a
+# 'feedback' event. A failing LLM call only retries the job; it no longer
+# holds up or kills the poll cycle.
+#
+# A taken job is leased to the pool's process and the lease renewed by a
+# heartbeat thread, which also puts jobs with expired leases (their process
+# died) back on the queue; jobs of other live processes are never taken over.
+
+import os
+import socket
+import threading
+import time
+import traceback
+
+from db import (
+    take_feedback_job,
+    finish_feedback_job,
+    renew_feedback_leases,
+    requeue_expired_feedback_jobs,
+    get_feedback_queue_stats,
+    get_history_since,
+    set_history_feedback,
+    record_feedback_written,
+    set_latest_feedback,
+    publish_game_event,
+)
+from llm_analysis import analyze_commits_with_llm
+from metrics import stage, game_context, feedback_jobs
+
+# Jobs sent to the LLM at the same time, and tries per job before it is
+# moved to the failed list
+FEEDBACK_WORKERS  = int(os.getenv('TDD_FEEDBACK_WORKERS', '2'))
+FEEDBACK_ATTEMPTS = int(os.getenv('TDD_FEEDBACK_ATTEMPTS', '3'))
+# Seconds a worker waits before taking the next job after a failure
+FEEDBACK_RETRY_DELAY = 5
+# Seconds a taken job stays leased without a heartbeat; renewed every third of it
+FEEDBACK_LEASE = 60
+
+
+def process_feedback_job(job: dict) -> bool:
+    """
+    Get LLM feedback for one job's commits and store it.
+    Returns False if the entries are gone (history reset since queued).
+    """
+    game_id, player_id = job['game_id'], job['player_id']
+    window = get_history_since(game_id, player_id, job['start'], len(job['commits']))
+    entries = window['entries']
+    if [e['commit'] for e in entries] != job['commits']:
+        return False
+
+    with game_context(game_id), stage('llm_feedback'):
+        feedback = analyze_commits_with_llm(entries)
+    per_commit = {}
+    for entry, item in zip(entries, feedback['per_commit_feedback']):
+        if entry['commit'] != item.get('commit'):
+            print('WARNING: commit sha does not match in feedback')
+        per_commit[entry['commit']] = item['feedback']
+
+    set_history_feedback(game_id, player_id, job['start'], per_commit)
+    record_feedback_written(game_id, player_id, list(per_commit))
+    latest = set_latest_feedback(game_id, player_id, job['start'] + len(entries),
+                                 feedback['overall_feedback'])
+    publish_game_event(game_id, 'feedback', {
+        'player_id': player_id,
+        'message': feedback['overall_feedback'] if latest else None,
+        'commits': per_commit,
+    })
+    return True
+
+
+class FeedbackWorkerPool:
+    """Threads serving the Redis feedback queue."""
+
+    def __init__(self, workers: int = FEEDBACK_WORKERS, attempts: int = FEEDBACK_ATTEMPTS):
+        self.workers = workers
+        self.attempts = attempts
+        self.owner = f'{socket.gethostname()}:{os.getpid()}'
+        self._lock = threading.Lock()
+        self._threads = []
+        self._held = set()     # raw jobs this pool's workers are on
+        self._completed = 0
+        self._retried = 0
+        self._failed = 0
+
+    def start(self):
+        """Start the workers and the lease heartbeat (once)."""
+        with self._lock:
+            if self._threads:
+                return
+            # the pid may have changed since construction (forked server workers)
+            self.owner = f'{socket.gethostname()}:{os.getpid()}'
+            heartbeat = threading.Thread(target=self._heartbeat, daemon=True,
+                                         name='feedback-heartbeat')
+            heartbeat.start()
+            self._threads.append(heartbeat)
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._run, daemon=True,
+                                          name=f'feedback-worker-{i}')
+                thread.start()
+                self._threads.append(thread)
+
+    def _heartbeat(self):
+        """Renew this pool's leases and requeue jobs whose lease expired."""
+        while True:
+            try:
+                with self._lock:
+                    held = list(self._held)
+                renew_feedback_leases(held, self.owner, FEEDBACK_LEASE)
+                moved = requeue_expired_feedback_jobs(FEEDBACK_LEASE)
+                if moved:
+                    print(f"Requeued {moved} feedback jobs with expired leases")
+            except Exception as e:
+                print(f"Feedback lease heartbeat error ({e})")
+            time.sleep(FEEDBACK_LEASE / 3)
+
+    def _run(self):
+        while True:
+            try:
+                taken = take_feedback_job(self.owner, FEEDBACK_LEASE)
+            except Exception as e:
+                print(f"Feedback queue error ({e}), retrying")
+                time.sleep(1)
+                continue
+            if taken is None:
+                continue
+            raw, job = taken
+            with self._lock:
+                self._held.add(raw)
+            try:
+                self._handle(raw, job)
+            except Exception as e:
+                # the job stays taken; it is requeued when its lease expires
+                print(f"Feedback queue error ({e}) finishing a job")
+            finally:
+                with self._lock:
+                    self._held.discard(raw)
+
+    def _handle(self, raw: str, job: dict):
+        """Process one taken job and finish, retry or fail it."""
+        try:
+            fresh = process_feedback_job(job)
+        except Exception as exc:
+            print(f"Feedback job {job['game_id']}/{job['player_id']} "
+                  f"(attempt {job.get('attempts', 0) + 1}) failed:")
+            traceback.print_exception(type(exc), exc, exc.__traceback__)
+            job['attempts'] = job.get('attempts', 0) + 1
+            if job['attempts'] < self.attempts:
+                finish_feedback_job(raw, retry=job)
+                feedback_jobs.inc(game=job['game_id'], outcome='retried')
+                with self._lock:
+                    self._retried += 1
+            else:
+                finish_feedback_job(raw, failed=True)
+                feedback_jobs.inc(game=job['game_id'], outcome='failed')
+                with self._lock:
+                    self._failed += 1
+            time.sleep(FEEDBACK_RETRY_DELAY)
+            return
+        finish_feedback_job(raw)
+        feedback_jobs.inc(game=job['game_id'], outcome='ok' if fresh else 'stale')
+        with self._lock:
+            self._completed += 1
+
+    def stats(self) -> dict:
+        """Queue lengths in Redis plus this process's job counters."""
+        stats = get_feedback_queue_stats()
+        with self._lock:
+            stats.update({
+                'workers':   self.workers,
+                'completed': self._completed,
+                'retried':   self._retried,
+                'gave_up':   self._failed,
+            })
+        return stats
@@ -1,9 +1,23 @@
 import os
+import random
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List, Dict
 
-from openai import AzureOpenAI
+import httpx
+from openai import (
+    AzureOpenAI,
+    RateLimitError,
+    APIConnectionError,
+    APITimeoutError,
+    InternalServerError,
+)
 from dotenv import load_dotenv
 import json
+
+from db import get_cached_feedback, cache_feedback, take_llm_tokens, block_llm_requests
 load_dotenv()   # reads .env into os.environ
 
 # Configuration: Azure OpenAI credentials and deployment name loaded from environment variables
@@ -11,12 +25,49 @@ AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
 AZURE_OPENAI_KEY = os.getenv("AZURE_OPENAI_KEY")
 AZURE_OPENAI_DEPLOYMENT = os.getenv("AZURE_OPENAI_DEPLOYMENT_NAME")
 
+# Completion budget per request, and how large batches are split: a chunk
+# holds at most LLM_CHUNK_INPUT_TOKENS of entries (estimated at ~4 characters
+# per token) and as many entries as fit the completion budget at
+# FEEDBACK_TOKENS_PER_COMMIT each, after OVERALL_FEEDBACK_TOKENS for the summary.
+# Up to LLM_CONCURRENCY chunks are sent at the same time.
+LLM_MAX_TOKENS             = 4096
+LLM_CHUNK_INPUT_TOKENS     = int(os.getenv('TDD_LLM_CHUNK_TOKENS', '8000'))
+LLM_CONCURRENCY            = int(os.getenv('TDD_LLM_CONCURRENCY', '4'))
+FEEDBACK_TOKENS_PER_COMMIT = 80
+OVERALL_FEEDBACK_TOKENS    = 300
+
+# Tokens per minute the deployment may be sent, shared by all workers
+# (0 disables the governor), and how often a throttled request is retried.
+LLM_TOKENS_PER_MINUTE = int(os.getenv('TDD_LLM_TPM', '30000'))
+LLM_RATE_RETRIES      = 5
+# Retries of a request that failed on the way (connection error, timeout,
+# 5xx), with exponential backoff capped at LLM_TRANSIENT_MAX_DELAY seconds
+LLM_TRANSIENT_RETRIES   = 3
+LLM_TRANSIENT_MAX_DELAY = 30
+
+PROMPT_PATH = 'prompt_fizzbuzz.txt'
+
+_client = None
+_client_lock = threading.Lock()
+_prompt = None          # (mtime, text, sha256)
+_prompt_lock = threading.Lock()
+
 
 def _get_client():
     """
-    Internal helper to instantiate the Azure OpenAI client.
+    The process-wide Azure OpenAI client, created on first use. It keeps a
+    pool of keep-alive connections for the concurrent feedback requests;
+    retries (throttling and transient errors) are left to _create_completion.
     Raises if any required environment variable is missing.
     """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = _new_client()
+        return _client
+
+
+def _new_client():
     if not all([AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_KEY, AZURE_OPENAI_DEPLOYMENT]):
         raise EnvironmentError(
             "Please set AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_KEY_OPENAI_DEPLOYMENT_NAME environment variables"
@@ -35,10 +86,77 @@ def _get_client():
         api_version=api_version,
         azure_endpoint=endpoint,
         api_key=subscription_key,
+        max_retries=0,
+        http_client=httpx.Client(limits=httpx.Limits(
+            max_connections=2 * LLM_CONCURRENCY,
+            max_keepalive_connections=2 * LLM_CONCURRENCY,
+        )),
     )
     return client
 
 
+def load_prompt(path: str = PROMPT_PATH):
+    """(text, sha256) of the prompt file, re-read only when its mtime changes."""
+    global _prompt
+    if not os.path.isfile(path):
+        raise FileNotFoundError(f"Prompt file not found: {path}")
+    mtime = os.path.getmtime(path)
+    with _prompt_lock:
+        if _prompt is None or _prompt[0] != mtime:
+            with open(path, 'r', encoding='utf-8') as f:
+                text = f.read()
+            _prompt = (mtime, text, hashlib.sha256(text.encode('utf-8')).hexdigest())
+        return _prompt[1], _prompt[2]
+
+
+def _retry_after(error: RateLimitError, attempt: int) -> float:
+    """Seconds to back off after a 429: the service's retry-after, else exponential."""
+    headers = error.response.headers if error.response is not None else {}
+    try:
+        if headers.get('retry-after-ms'):
+            return float(headers['retry-after-ms']) / 1000
+        if headers.get('retry-after'):
+            return float(headers['retry-after'])
+    except ValueError:
+        pass
+    return min(60, 2 ** attempt)
+
+
+def _create_completion(client, messages: List[Dict], **kwargs):
+    """
+    chat.completions.create under the shared token budget: waits until the
+    bucket grants the estimated prompt + completion tokens, and on 429 makes
+    every worker back off for the retry-after the service asked for.
+    Connection errors, timeouts and 5xx answers are retried by this worker
+    alone, up to LLM_TRANSIENT_RETRIES times with jittered exponential backoff.
+    """
+    estimate = sum(len(m['content']) for m in messages) // 4 + kwargs['max_tokens']
+    rate_attempts = transient_attempts = 0
+    while True:
+        if LLM_TOKENS_PER_MINUTE > 0:
+            while True:
+                wait = take_llm_tokens(estimate, LLM_TOKENS_PER_MINUTE)
+                if wait <= 0:
+                    break
+                time.sleep(wait)
+        try:
+            return client.chat.completions.create(messages=messages, **kwargs)
+        except RateLimitError as e:
+            if rate_attempts == LLM_RATE_RETRIES:
+                raise
+            delay = _retry_after(e, rate_attempts)
+            rate_attempts += 1
+            print(f"LLM rate limited, backing off {delay:.1f}s")
+            block_llm_requests(delay)
+        except (APIConnectionError, APITimeoutError, InternalServerError) as e:
+            if transient_attempts == LLM_TRANSIENT_RETRIES:
+                raise
+            delay = min(LLM_TRANSIENT_MAX_DELAY, 2 ** transient_attempts) * random.uniform(0.5, 1)
+            transient_attempts += 1
+            print(f"LLM request failed ({type(e).__name__}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
 def test_api_call() -> str:
     """
     Test function to verify that the Azure OpenAI API is reachable and returns a valid response.
@@ -73,14 +191,118 @@ def extract_json(text: str) -> str:
     return text[start:end]
 
 
+def _normalize_entry(entry: Dict) -> Dict:
+    """The fields of a commit entry the feedback depends on (no SHA, no feedback)."""
+    analysis = entry.get('analysis', {})
+    return {
+        'commit_classify': analysis.get('commit_classify'),
+        'tests_passed':    bool(analysis.get('tests_passed')),
+        'is_refactoring':  bool(analysis.get('is_refactoring')),
+        'is_merge':        bool(entry.get('is_merge')),
+        'branches':        sorted(entry.get('branches') or []),
+        'message':         entry.get('message', ''),
+    }
+
+
+def _digest(prompt_hash: str, payload) -> str:
+    return hashlib.sha256(
+        (prompt_hash + json.dumps(payload, sort_keys=True)).encode('utf-8')
+    ).hexdigest()
+
+
+def _estimate_tokens(entry: Dict) -> int:
+    return len(json.dumps(entry)) // 4 + 1
+
+
+def chunk_entries(indices: List[int], entries: List[Dict]) -> List[List[int]]:
+    """
+    Split the entry indices to send into consecutive chunks that fit the
+    input and completion token budgets (see LLM_CHUNK_INPUT_TOKENS).
+    """
+    max_commits = max(1, (LLM_MAX_TOKENS - OVERALL_FEEDBACK_TOKENS) // FEEDBACK_TOKENS_PER_COMMIT)
+    chunks, chunk, tokens = [], [], 0
+    for i in indices:
+        cost = _estimate_tokens(entries[i])
+        if chunk and (len(chunk) == max_commits or tokens + cost > LLM_CHUNK_INPUT_TOKENS):
+            chunks.append(chunk)
+            chunk, tokens = [], 0
+        chunk.append(i)
+        tokens += cost
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
 def analyze_commits_with_llm(entries: List[Dict]) -> Dict:
     """
-    Calls the LLM with a system prompt (loaded from prompt_path) and the list of commit entries.
+    Per-commit and overall feedback for a list of commit entries, from the
+    feedback cache where possible (see db.get_cached_feedback).
+
+    Each entry's feedback is cached under the hash of the prompt plus the
+    normalized entry, the overall feedback under the hash of the prompt plus
+    the whole normalized batch. Only uncached entries are sent to the LLM,
+    in token-bounded chunks (chunk_entries) requested concurrently; the
+    answers are stitched back in the original order.
+
+    Each chunk is validated and retried on its own. Answers of the chunks
+    that succeeded are cached before a failed chunk raises, so a retry of
+    the batch only sends what is still missing.
+
+    Returns:
+        Dict with keys 'per_commit_feedback' and 'overall_feedback', as
+        _request_llm_feedback.
+    """
+    system_prompt, prompt_hash = load_prompt()
+
+    normalized = [_normalize_entry(e) for e in entries]
+    digests = [_digest(prompt_hash, n) for n in normalized]
+    batch_digest = _digest(prompt_hash, normalized)
+    cached = [get_cached_feedback(d) for d in digests]
+    overall = get_cached_feedback(batch_digest)
+
+    missing = [i for i, text in enumerate(cached) if text is None]
+    if missing or overall is None:
+        # with every entry cached, the whole batch is needed for the summary
+        chunks = chunk_entries(missing or list(range(len(entries))), entries)
+        overalls = {}
+        errors = []
+        with ThreadPoolExecutor(max_workers=min(LLM_CONCURRENCY, len(chunks))) as pool:
+            futures = {
+                pool.submit(_request_llm_feedback, [entries[i] for i in chunk], system_prompt): n
+                for n, chunk in enumerate(chunks)
+            }
+            for future in as_completed(futures):
+                n = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    errors.append(f"chunk {n + 1}/{len(chunks)}: {e}")
+                    continue
+                for i, item in zip(chunks[n], result['per_commit_feedback']):
+                    cached[i] = item['feedback']
+                    cache_feedback(digests[i], item['feedback'])
+                overalls[n] = result['overall_feedback']
+        if errors:
+            raise RuntimeError("LLM feedback failed for " + "; ".join(errors))
+        # the chunk with the latest commits has the most current summary
+        overall = overalls[len(chunks) - 1]
+        cache_feedback(batch_digest, overall)
+
+    return {
+        'per_commit_feedback': [{'commit': e['commit'], 'feedback': text}
+                                for e, text in zip(entries, cached)],
+        'overall_feedback': overall,
+    }
+
+
+def _request_llm_feedback(entries: List[Dict], system_prompt: str) -> Dict:
+    """
+    Calls the LLM with the system prompt and the list of commit entries.
     Parses the JSON response, validates its structure, and retries up to 3 times if invalid.
 
     Args:
         entries: List of commit entry dicts as defined in the game schema.
-        prompt_path: Path to the .txt file containing the LLM prompt.
+        system_prompt: Contents of the prompt file.
 
     Returns:
         Parsed JSON dict with keys 'per_commit_feedback' and 'overall_feedback'.
@@ -88,13 +310,6 @@ def analyze_commits_with_llm(entries: List[Dict]) -> Dict:
     Raises:
         RuntimeError: If a valid response isn't obtained after 3 attempts.
     """
-    # Load the prompt
-    prompt_path = 'prompt_fizzbuzz.txt'
-    if not os.path.isfile(prompt_path):
-        raise FileNotFoundError(f"Prompt file not found: {prompt_path}")
-    with open(prompt_path, 'r', encoding='utf-8') as f:
-        system_prompt = f.read()
-
     client: OpenAIClient = _get_client()
     # Initial messages
     messages = [
@@ -105,9 +320,10 @@ def analyze_commits_with_llm(entries: List[Dict]) -> Dict:
     last_error = None
     # Retry loop
     for attempt in range(1, 4):
-        response = client.chat.completions.create(
-            messages=messages,
-            max_tokens=4096,
+        response = _create_completion(
+            client,
+            messages,
+            max_tokens=LLM_MAX_TOKENS,
             top_p=1.0,
             model=AZURE_OPENAI_DEPLOYMENT,
             temperature=0.7
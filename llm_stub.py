@@ -0,0 +1,130 @@
+# llm_stub.py
+# Local stand-in for the Azure OpenAI chat completions endpoint, so the poll
+# pipeline can run (and be benchmarked) offline:
+#
+#   python llm_stub.py --port 8099 --latency 0.5 --error-rate 0.05
+#   AZURE_OPENAI_ENDPOINT=http://127.0.0.1:8099 AZURE_OPENAI_KEY=stub \
+#   AZURE_OPENAI_DEPLOYMENT_NAME=stub python app.py
+#
+# Any POST to a path ending in /chat/completions is answered with the JSON
+# the feedback prompt asks for: one 'per_commit_feedback' item per commit in
+# the request and an 'overall_feedback'. Latency, server errors and malformed
+# answers are configurable to exercise the retry paths.
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _commits_of(messages: list) -> list:
+    """The commit entries sent in the first user message ({"commits": [...]})."""
+    for message in messages:
+        if message.get('role') != 'user':
+            continue
+        try:
+            return json.loads(message['content'])['commits']
+        except (ValueError, KeyError, TypeError):
+            continue
+    return []
+
+
+def _feedback_for(commits: list) -> dict:
+    per_commit = []
+    for entry in commits:
+        classify = entry.get('analysis', {}).get('commit_classify', 'unknown')
+        per_commit.append({
+            'commit': entry.get('commit'),
+            'feedback': f"Stub feedback: {classify} commit.",
+        })
+    return {
+        'per_commit_feedback': per_commit,
+        'overall_feedback': f"Stub summary of {len(commits)} commits.",
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # set on the server: latency, jitter, error_rate, malformed_rate, requests
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        with server.lock:
+            server.requests += 1
+        time.sleep(max(0.0, random.gauss(server.latency, server.jitter)))
+
+        if random.random() < server.error_rate:
+            self._reply(500, {'error': {'message': 'stub server error', 'type': 'server_error'}})
+            return
+        if not self.path.split('?')[0].endswith('/chat/completions'):
+            self._reply(404, {'error': {'message': 'not found'}})
+            return
+
+        request = json.loads(body or b'{}')
+        feedback = _feedback_for(_commits_of(request.get('messages', [])))
+        content = json.dumps(feedback)
+        if random.random() < server.malformed_rate:
+            # truncated JSON, as from a completion cut off at max_tokens
+            content = content[:len(content) // 2] + '}'
+        self._reply(200, {
+            'id': f"chatcmpl-stub-{server.requests}",
+            'object': 'chat.completion',
+            'created': int(time.time()),
+            'model': request.get('model', 'stub'),
+            'choices': [{
+                'index': 0,
+                'message': {'role': 'assistant', 'content': content},
+                'finish_reason': 'stop',
+            }],
+            'usage': {'prompt_tokens': len(body) // 4,
+                      'completion_tokens': len(content) // 4,
+                      'total_tokens': (len(body) + len(content)) // 4},
+        })
+
+    def _reply(self, status: int, payload: dict):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve(port: int = 8099, latency: float = 0.5, jitter: float = 0.0,
+          error_rate: float = 0.0, malformed_rate: float = 0.0,
+          background: bool = False) -> ThreadingHTTPServer:
+    """
+    Start the stub on 127.0.0.1:port (0 picks a free port, see
+    server.server_port). With background=True it runs on a daemon thread
+    and the server is returned; otherwise this blocks.
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.jitter = jitter
+    server.error_rate = error_rate
+    server.malformed_rate = malformed_rate
+    server.requests = 0
+    server.lock = threading.Lock()
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    else:
+        print(f"LLM stub listening on http://127.0.0.1:{server.server_port}")
+        server.serve_forever()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="OpenAI-compatible LLM stub server")
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0.5, help="mean seconds per answer")
+    parser.add_argument('--jitter', type=float, default=0.1, help="std-dev of the latency")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of HTTP 500 answers")
+    parser.add_argument('--malformed-rate', type=float, default=0.0,
+                        help="fraction of answers with truncated JSON")
+    args = parser.parse_args()
+    serve(args.port, args.latency, args.jitter, args.error_rate, args.malformed_rate)
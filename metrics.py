@@ -0,0 +1,176 @@
+# metrics.py
+# Stage timings and counters of the poller, exposed in the Prometheus text
+# format on /tdd-game/metrics.
+#
+# Observations are written to Redis hashes (one per metric) rather than kept
+# in memory, so poll jobs on worker processes (TDD_POLL_EXECUTOR=process) and
+# feedback workers of every process land in the same series. Stage timings
+# are labeled with the game the current job belongs to (see game_context).
+# TDD_METRICS=0 turns every observation into a no-op.
+
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from db import redis_client
+
+METRICS_ENABLED = os.getenv('TDD_METRICS', '1') != '0'
+
+metric_hash = 'tddgame:metrics:{name}'
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Game whose job is running in this thread / context ('' outside a job)
+current_game = ContextVar('current_game', default='')
+
+_registry = []
+
+
+@contextmanager
+def game_context(game_id: str):
+    """Label the stages observed inside the block with game_id."""
+    token = current_game.set(game_id)
+    try:
+        yield
+    finally:
+        current_game.reset(token)
+
+
+def _label_text(labels: dict) -> str:
+    return ','.join(f'{k}="{str(v)}"' for k, v in sorted(labels.items()))
+
+
+def _format_value(value: float) -> str:
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _render_series(name: str, kind: str, help_text: str, values: dict) -> list:
+    """Text lines of a counter/gauge from {label_text: value}."""
+    lines = [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+    for labels, value in sorted(values.items()):
+        labels = f'{{{labels}}}' if labels else ''
+        lines.append(f'{name}{labels} {_format_value(float(value))}')
+    return lines
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self.key = metric_hash.format(name=name)
+        _registry.append(self)
+
+    def _labels(self, labels: dict) -> dict:
+        if 'game' in labels and labels['game'] is None:
+            labels['game'] = current_game.get()
+        return labels
+
+    def render(self, raw: dict) -> list:
+        return _render_series(self.name, self.kind, self.help, raw)
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        if METRICS_ENABLED:
+            redis_client.hincrbyfloat(self.key, _label_text(self._labels(labels)), amount)
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        if METRICS_ENABLED:
+            redis_client.hset(self.key, _label_text(self._labels(labels)), value)
+
+
+class Histogram(_Metric):
+    """Bucket counts are stored per bucket and made cumulative when rendered."""
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        text = _label_text(self._labels(labels))
+        bucket = next((b for b in self.buckets if value <= b), '+Inf')
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hincrby(self.key, f'{text}\x1fle={bucket}', 1)
+        pipe.hincrby(self.key, f'{text}\x1fcount', 1)
+        pipe.hincrbyfloat(self.key, f'{text}\x1fsum', value)
+        pipe.execute()
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of the block (also when it raises)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self, raw: dict) -> list:
+        series = {}
+        for field, value in raw.items():
+            labels, suffix = field.split('\x1f', 1)
+            series.setdefault(labels, {})[suffix] = float(value)
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for labels, values in sorted(series.items()):
+            sep = ',' if labels else ''
+            cumulative = 0
+            for bucket in self.buckets + ('+Inf',):
+                cumulative += values.get(f'le={bucket}', 0)
+                lines.append(f'{self.name}_bucket{{{labels}{sep}le="{bucket}"}} {int(cumulative)}')
+            lines.append(f'{self.name}_sum{{{labels}}} {_format_value(values.get("sum", 0))}')
+            lines.append(f'{self.name}_count{{{labels}}} {int(values.get("count", 0))}')
+        return lines
+
+
+# ------------------- Poller metrics -------------------
+stage_seconds = Histogram(
+    'tdd_stage_seconds',
+    'Time spent per poller stage (git_ls_remote, git_clone, git_pull, git_checkout, git_log, '
+    'branch_index, snapshot, pytest, detect_refactoring, classify, score, '
+    'redis_write, llm_feedback)')
+player_job_seconds = Histogram(
+    'tdd_player_job_seconds', 'Duration of one pull -> classify -> score job for a player')
+poll_turnaround_seconds = Histogram(
+    'tdd_poll_turnaround_seconds',
+    "Time from a player's poll coming due to its job finishing (queue wait included)")
+poll_backlog = Gauge(
+    'tdd_poll_backlog', 'Poll jobs queued or in flight (state=queued|in_flight)')
+commits_processed = Counter(
+    'tdd_commits_processed_total', 'Commits classified and scored')
+feedback_jobs = Counter(
+    'tdd_feedback_jobs_total', 'Feedback jobs finished (outcome=ok|retried|failed|stale)')
+webhook_deliveries = Counter(
+    'tdd_webhook_deliveries_total',
+    'Push webhooks received (outcome=poll|ignored|unknown_repo|bad_signature|bad_payload)')
+
+
+def stage(name: str):
+    """stage_seconds timer for the current game: `with stage('pytest'): ...`"""
+    return stage_seconds.time(stage=name, game=None)
+
+
+def render_metrics(extra_gauges: dict = None) -> str:
+    """
+    All registered metrics in the Prometheus text format, plus extra_gauges
+    ({name: (help, {label_text: value})}) computed at scrape time.
+    """
+    pipe = redis_client.pipeline(transaction=False)
+    for metric in _registry:
+        pipe.hgetall(metric.key)
+    lines = []
+    for metric, raw in zip(_registry, pipe.execute()):
+        lines.extend(metric.render(raw))
+    for name, (help_text, values) in (extra_gauges or {}).items():
+        lines.extend(_render_series(name, 'gauge', help_text, values))
+    return '\n'.join(lines) + '\n'
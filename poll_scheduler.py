@@ -0,0 +1,220 @@
+# poll_scheduler.py
+# Bounded worker pool and adaptive poll planning used by the repo poller in app.py
+
+import os
+import heapq
+import threading
+import time
+import traceback
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# Number of players that can be pulled/classified/scored at the same time,
+# and whether the jobs run on threads or on worker processes.
+POLL_WORKERS  = int(os.getenv('TDD_POLL_WORKERS', '4'))
+POLL_EXECUTOR = os.getenv('TDD_POLL_EXECUTOR', 'thread')
+
+# Start method of process workers. The poller runs in a multithreaded process
+# (Flask, poll loop, feedback workers), and a plain fork could copy a lock
+# another thread holds (Redis connection pool, logging) into the child, where
+# it is never released. Workers are started from a fresh interpreter instead
+# and import app.py for process_player (see the main-process guard there).
+POLL_START_METHOD = ('forkserver' if 'forkserver' in multiprocessing.get_all_start_methods()
+                     else 'spawn')
+
+# Adaptive polling: a player is polled every POLL_MIN_INTERVAL seconds while
+# new commits keep arriving, the interval doubles after each poll that found
+# nothing, up to POLL_MAX_INTERVAL. At most POLL_RATE polls (each at least one
+# git ref query) are started per second across all players.
+POLL_MIN_INTERVAL = float(os.getenv('TDD_POLL_MIN_INTERVAL', '2'))
+POLL_MAX_INTERVAL = float(os.getenv('TDD_POLL_MAX_INTERVAL', '120'))
+POLL_RATE         = float(os.getenv('TDD_POLL_RATE', '5'))
+
+
+class PlayerJobScheduler:
+    """
+    Sends one job per player to a thread or process pool.
+
+    Jobs are keyed by (game_id, player_id): while a player's job is queued or
+    running, submitting another one for the same key is a no-op, so a slow
+    clone or test run never gets two cycles racing on the same working copy.
+    """
+
+    def __init__(self, max_workers: int = POLL_WORKERS, kind: str = POLL_EXECUTOR,
+                 on_done=None):
+        """on_done(key, result) is called after each job; result is None if it failed."""
+        if kind == 'process':
+            self._executor = ProcessPoolExecutor(
+                max_workers=max_workers,
+                mp_context=multiprocessing.get_context(POLL_START_METHOD)
+            )
+        elif kind == 'thread':
+            self._executor = ThreadPoolExecutor(
+                max_workers=max_workers,
+                thread_name_prefix='poll-worker'
+            )
+        else:
+            raise ValueError(f"Unknown executor kind: {kind!r}")
+        self.kind = kind
+        self.max_workers = max_workers
+        self.on_done = on_done
+        self._lock = threading.Lock()
+        self._jobs = {}        # key -> Future (queued or running)
+        self._completed = 0
+        self._failed = 0
+
+    def submit(self, key, fn, *args) -> bool:
+        """
+        Queue fn(*args) for the given key.
+        Returns False (and does nothing) if a job for that key is still pending.
+        """
+        with self._lock:
+            if key in self._jobs:
+                return False
+            future = self._executor.submit(fn, *args)
+            self._jobs[key] = future
+        future.add_done_callback(lambda f, key=key: self._job_done(key, f))
+        return True
+
+    def _job_done(self, key, future):
+        failed = future.cancelled() or future.exception() is not None
+        with self._lock:
+            self._jobs.pop(key, None)
+            if failed:
+                self._failed += 1
+            else:
+                self._completed += 1
+        if not future.cancelled() and future.exception() is not None:
+            exc = future.exception()
+            print(f"Poll job {key} failed:")
+            traceback.print_exception(type(exc), exc, exc.__traceback__)
+        if self.on_done is not None:
+            self.on_done(key, None if failed else future.result())
+
+    def is_pending(self, key) -> bool:
+        with self._lock:
+            return key in self._jobs
+
+    def stats(self) -> dict:
+        """Return queue depth, in-flight job count and completion counters."""
+        with self._lock:
+            running = sum(1 for f in self._jobs.values() if f.running())
+            return {
+                'executor':  self.kind,
+                'workers':   self.max_workers,
+                'queued':    len(self._jobs) - running,
+                'in_flight': running,
+                'completed': self._completed,
+                'failed':    self._failed,
+            }
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
+
+
+class AdaptivePollPlanner:
+    """
+    Decides which players are due for a poll: a heap of next-poll times,
+    with per-player intervals that reset to POLL_MIN_INTERVAL on activity
+    and back off exponentially while idle, and a token bucket holding the
+    polls started to POLL_RATE per second.
+
+    A player handed out by due() has no next-poll time until record() is
+    called with its job's result (PlayerJobScheduler's on_done).
+    """
+
+    def __init__(self, min_interval: float = POLL_MIN_INTERVAL,
+                 max_interval: float = POLL_MAX_INTERVAL, rate: float = POLL_RATE):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.rate = rate
+        # bucket size: a second's worth of polls, and at least one poll so a
+        # rate below 1/s still lets a poll through every 1/rate seconds
+        self.burst = max(1.0, rate)
+        self._lock = threading.Lock()
+        self._heap = []        # (next_poll, key); entries not matching _state are stale
+        # key -> {'next_poll': float | None, 'interval': float, 'idle_polls': int,
+        #         'poked': bool (poke() while a poll was running)}
+        self._state = {}
+        self._tokens = self.burst
+        self._due_at = {}      # key -> when the poll handed out by due() came due
+        self._refilled = time.monotonic()
+
+    def _schedule(self, key, at: float):
+        self._state[key]['next_poll'] = at
+        heapq.heappush(self._heap, (at, key))
+
+    def sync(self, keys):
+        """Track exactly these players: new ones are due now, missing ones are dropped."""
+        now = time.time()
+        keys = set(keys)
+        with self._lock:
+            for key in list(self._state):
+                if key not in keys:
+                    del self._state[key]
+            for key in keys - set(self._state):
+                self._state[key] = {'next_poll': None, 'interval': self.min_interval,
+                                    'idle_polls': 0, 'poked': False}
+                self._schedule(key, now)
+
+    def due(self) -> list:
+        """Players whose next poll has come, as many as the rate budget allows."""
+        now = time.time()
+        with self._lock:
+            elapsed = time.monotonic() - self._refilled
+            self._refilled += elapsed
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+            keys = []
+            while self._heap and self._heap[0][0] <= now and self._tokens >= 1:
+                at, key = heapq.heappop(self._heap)
+                state = self._state.get(key)
+                if state is None or state['next_poll'] != at:
+                    continue
+                state['next_poll'] = None
+                self._due_at[key] = at
+                self._tokens -= 1
+                keys.append(key)
+            return keys
+
+    def record(self, key, new_commits):
+        """
+        Reschedule a player after its poll found new_commits (None: the job
+        failed). Returns the seconds since that poll came due, or None if the
+        player was not handed out by due().
+        """
+        with self._lock:
+            due_at = self._due_at.pop(key, None)
+            turnaround = time.time() - due_at if due_at is not None else None
+            state = self._state.get(key)
+            if state is None:
+                return turnaround
+            if new_commits or state['poked']:
+                state['interval'] = self.min_interval
+                state['idle_polls'] = 0
+            else:
+                state['interval'] = min(self.max_interval, state['interval'] * 2)
+                state['idle_polls'] += 1
+            if state['next_poll'] is None:
+                # poked mid-poll: the push may have landed after this poll read the ref
+                delay = 0 if state['poked'] else state['interval']
+                state['poked'] = False
+                self._schedule(key, time.time() + delay)
+            return turnaround
+
+    def poke(self, key):
+        """Poll a player as soon as possible and treat it as active again."""
+        with self._lock:
+            state = self._state.get(key)
+            if state is None:
+                return
+            state['interval'] = self.min_interval
+            state['idle_polls'] = 0
+            if state['next_poll'] is None:
+                state['poked'] = True
+            else:
+                self._schedule(key, time.time())
+
+    def snapshot(self) -> dict:
+        """{key: {'next_poll' (epoch seconds, None while polling), 'interval', 'idle_polls', 'poked'}}"""
+        with self._lock:
+            return {key: dict(state) for key, state in self._state.items()}
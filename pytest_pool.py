@@ -0,0 +1,206 @@
+# pytest_pool.py
+# Warm pytest workers used by commit_analysis.run_pytest
+#
+# Most of the time of a kata test run is interpreter start-up and pytest
+# imports, not the (tiny) student suite. Each worker here is a long-lived
+# "template" process that imports pytest and its builtin plugins once and
+# then, for every job, forks a child that runs pytest.main() in the
+# snapshot directory. The child exits after the run, so student modules
+# never leak into the template or into the next job.
+#
+# Protocol (one JSON object per line over the template's stdin/stdout):
+#   request : {"cwd": <dir>, "report": <json report path>, "timeout": <s>}
+#   response: {"exitstatus": <int or null>, "timed_out": <bool>}
+
+import os
+import sys
+import json
+import queue
+import signal
+import subprocess
+import threading
+import time
+
+# Number of warm workers (0 disables the pool, every run is a plain subprocess)
+WARM_WORKERS   = int(os.getenv('TDD_PYTEST_WARM_WORKERS', '4'))
+PYTEST_TIMEOUT = int(os.getenv('TDD_PYTEST_TIMEOUT', '120'))
+
+# A repo shipping any of these brings its own dependencies/configuration,
+# so it is tested in a fresh `pytest` subprocess instead.
+OWN_ENV_MARKERS = (
+    'requirements.txt', 'pyproject.toml', 'setup.py', 'setup.cfg',
+    'Pipfile', 'environment.yml', 'tox.ini',
+)
+
+
+def needs_own_environment(repo_path: str) -> bool:
+    return any(os.path.exists(os.path.join(repo_path, name))
+               for name in OWN_ENV_MARKERS)
+
+
+class _Worker:
+    """Handle on one template process."""
+
+    def __init__(self):
+        self.proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+        )
+
+    def alive(self) -> bool:
+        return self.proc.poll() is None
+
+    def run(self, cwd: str, report_path: str, timeout: int) -> dict:
+        self.proc.stdin.write(json.dumps(
+            {'cwd': cwd, 'report': report_path, 'timeout': timeout}) + '\n')
+        self.proc.stdin.flush()
+        line = self.proc.stdout.readline()
+        if not line:
+            raise RuntimeError("pytest worker exited")
+        return json.loads(line)
+
+    def close(self):
+        if self.alive():
+            self.proc.stdin.close()
+            self.proc.wait(timeout=5)
+
+
+class WarmPytestPool:
+    """Fixed-size pool of warm pytest template processes."""
+
+    def __init__(self, workers: int = WARM_WORKERS):
+        self.size = workers
+        self._idle = queue.Queue()
+        for _ in range(workers):
+            self._idle.put(_Worker())
+
+    def run(self, cwd: str, report_path: str, timeout: int = PYTEST_TIMEOUT) -> dict:
+        """
+        Run pytest in cwd on a warm worker; the report is written to report_path.
+        Returns {'exitstatus': int | None, 'timed_out': bool}; a run still going
+        after timeout seconds is killed (and leaves no report).
+        Raises RuntimeError if the worker died (it is replaced for the next job).
+        """
+        worker = self._idle.get()
+        try:
+            return worker.run(cwd, report_path, timeout)
+        except (OSError, ValueError, RuntimeError) as e:
+            worker.proc.kill()
+            worker = None
+            raise RuntimeError(f"pytest worker failed: {e}")
+        finally:
+            self._idle.put(worker if worker is not None and worker.alive()
+                           else _Worker())
+
+    def close(self):
+        while not self._idle.empty():
+            self._idle.get().close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_warm_pool():
+    """Return the process-wide pool (started on first use), or None if disabled."""
+    global _pool
+    if WARM_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = WarmPytestPool(WARM_WORKERS)
+        return _pool
+
+
+# ------------------- template process -------------------
+WARMUP_MODULE = 'tdd_pool_warmup_test'
+
+
+def _preload():
+    """
+    Import pytest and every builtin plugin, then run one throwaway session:
+    much of pytest is imported lazily on the first pytest.main(), and that
+    first run is what forked children should not have to pay for.
+    """
+    import importlib
+    import tempfile
+    import shutil
+    import pytest
+    from _pytest.config import default_plugins
+    for name in default_plugins:
+        try:
+            importlib.import_module('_pytest.' + name)
+        except ImportError:
+            pass
+    import pytest_report_plugin
+
+    warmup_dir = tempfile.mkdtemp(prefix='tdd-pytest-warmup-')
+    saved_fds = [os.dup(fd) for fd in (1, 2)]
+    devnull = os.open(os.devnull, os.O_WRONLY)
+    try:
+        with open(os.path.join(warmup_dir, WARMUP_MODULE + '.py'), 'w') as f:
+            f.write("def test_warmup():\n    assert True\n")
+        os.dup2(devnull, 1)
+        os.dup2(devnull, 2)
+        pytest.main(["-q", "-p", "no:cacheprovider", warmup_dir])
+    finally:
+        for fd, saved in zip((1, 2), saved_fds):
+            os.dup2(saved, fd)
+            os.close(saved)
+        os.close(devnull)
+        shutil.rmtree(warmup_dir, ignore_errors=True)
+        # keep the template free of anything the warm-up imported from disk
+        sys.modules.pop(WARMUP_MODULE, None)
+        if warmup_dir in sys.path:
+            sys.path.remove(warmup_dir)
+    return pytest, pytest_report_plugin
+
+
+def _run_child(pytest, plugin, cwd, report_path):
+    """Body of the forked child: run the suite in cwd and exit with pytest's status."""
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+    os.dup2(devnull, 2)
+    os.chdir(cwd)
+    sys.path.insert(0, cwd)
+    os.environ[plugin.REPORT_ENV] = report_path
+    status = 1
+    try:
+        status = int(pytest.main(
+            ["-q", "--disable-warnings", "-p", "no:cacheprovider"],
+            plugins=[plugin]))
+    finally:
+        os._exit(status)
+
+
+def _serve():
+    pytest, plugin = _preload()
+    for line in sys.stdin:
+        job = json.loads(line)
+        pid = os.fork()
+        if pid == 0:
+            _run_child(pytest, plugin, job['cwd'], job['report'])
+
+        deadline = time.monotonic() + job.get('timeout', PYTEST_TIMEOUT)
+        status, timed_out = None, False
+        while True:
+            done, raw = os.waitpid(pid, os.WNOHANG)
+            if done:
+                status = os.waitstatus_to_exitcode(raw)
+                break
+            if time.monotonic() > deadline:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+                timed_out = True
+                break
+            time.sleep(0.005)
+        sys.stdout.write(json.dumps({'exitstatus': status, 'timed_out': timed_out}) + '\n')
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    _serve()
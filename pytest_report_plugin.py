@@ -0,0 +1,47 @@
+# pytest_report_plugin.py
+# pytest plugin loaded by commit_analysis.run_pytest (`pytest -p pytest_report_plugin`).
+#
+# Records, in a single test run, how many tests were collected, the session's
+# exit status and the outcome of every test, and writes them as JSON to the
+# file named by $TDD_PYTEST_REPORT:
+#   {
+#     "collected":  <int>,
+#     "exitstatus": <int>,
+#     "passed":     <bool>,
+#     "outcomes":   { "<nodeid>": "passed" | "failed" | "skipped" | "error" }
+#   }
+
+import os
+import json
+
+REPORT_ENV = 'TDD_PYTEST_REPORT'
+
+_report = {'collected': 0, 'outcomes': {}}
+
+
+def pytest_collection_finish(session):
+    _report['collected'] = len(session.items)
+
+
+def pytest_runtest_logreport(report):
+    outcomes = _report['outcomes']
+    if report.when == 'call':
+        outcomes.setdefault(report.nodeid, report.outcome)
+    elif report.failed:
+        # setup/teardown failures count as errors, even after a passing call
+        outcomes[report.nodeid] = 'error'
+    elif report.skipped:
+        outcomes.setdefault(report.nodeid, 'skipped')
+
+
+def pytest_sessionfinish(session, exitstatus):
+    path = os.environ.get(REPORT_ENV)
+    if not path:
+        return
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'collected':  _report['collected'],
+            'exitstatus': int(exitstatus),
+            'passed':     int(exitstatus) == 0,
+            'outcomes':   _report['outcomes'],
+        }, f)
@@ -144,3 +144,77 @@ def score_all(commits_info: list) -> dict:
         "per_commit":    detailed,
         "overall_score": round(overall, 2)
     }
+
+# 6) Incremental scoring: the same numbers as score_all, one commit at a time.
+#
+# score_all rescans the whole history for every new commit. The running state
+# below holds everything those back-scans need, so each new commit is scored
+# in O(1):
+#   count         : number of commits scored so far (index of the next one)
+#   merges        : merges among commits 1..count-1 (score_all skips index 0)
+#   unknown_run   : 'unknown' commits in a row at the end (index 0 excluded)
+#   prev_classify : classification of the last commit (for transitions)
+#   total         : running sum of per-commit totals (overall_score unrounded)
+def new_score_state() -> dict:
+    return {
+        "count":         0,
+        "merges":        0,
+        "unknown_run":   0,
+        "prev_classify": "",
+        "total":         0.0,
+    }
+
+def score_next(state: dict, ci: dict) -> dict:
+    """Score one commit after those already folded into state; updates state in place."""
+    i = state["count"]
+    cls = ci["analysis"]["commit_classify"]
+    is_merge = bool(ci["is_merge"])
+
+    if 'num_merges' not in ci:
+        nmerges = state["merges"] + (1 if is_merge and i > 0 else 0)
+        ci['num_merges'] = (nmerges / i) if i > 0 else 0
+        ci['bad_in_row'] = state["unknown_run"] if cls == 'unknown' else 0
+
+    b = score_commit_info(ci)
+    if i == 0:
+        t, tdesc = 0.0, 'first'
+    else:
+        t, tdesc = transition_score(state["prev_classify"], cls), (state["prev_classify"], cls)
+
+    mp = 0.0
+    if ci["is_merge"] and cls != "green":
+        mp = MERGE_NONGREEN_PENALTY
+    elif ci['is_merge']:
+        mp = MERGE_BONUS
+
+    total_sc = round(b + t + mp, 2)
+    state["total"] += total_sc
+    if i > 0 and is_merge:
+        state["merges"] += 1
+    if i > 0 and cls == 'unknown':
+        state["unknown_run"] += 1
+    else:
+        state["unknown_run"] = 0
+    state["prev_classify"] = cls
+    state["count"] = i + 1
+
+    return {
+        "commit":           ci["commit"],
+        "branches":         ci["branches"],
+        "base_score":       b,
+        "transition_bonus": t,
+        "transition":       tdesc,
+        "merge_score":      mp,
+        "total_score":      total_sc
+    }
+
+def score_incremental(state: dict, new_commits: list) -> dict:
+    """
+    Fold new_commits into state and return the same shape as score_all,
+    with per_commit covering only the new commits.
+    """
+    detailed = [score_next(state, ci) for ci in new_commits]
+    return {
+        "per_commit":    detailed,
+        "overall_score": round(state["total"], 2)
+    }
@@ -0,0 +1,182 @@
+# synthetic_kata.py
+# Generates kata repositories with a known commit sequence for the benchmarks.
+#
+# The kata follows the layout classify_commit expects (production code in
+# calc.py, tests in test_*.py). Every TDD step works on a function f_k:
+#   red      : test_calc_k.py calls calc.f_k, which does not exist yet
+#   green    : calc.py gains the oldest f_k that has a failing test
+#   refactor : the oldest f_k not yet refactored returns through a local
+#              (same behavior, different AST, so detect_refactoring sees it)
+#   mixed    : test and implementation of a new f_k in one commit ('unknown')
+# A repo can be generated in one go (generate_kata_repo: commit count, step
+# mix, feature branches, merge style, size of the passing test suite) or
+# grown one commit at a time (KataRepo.next_commit, used by bench_poll.py).
+
+import os
+import random
+import subprocess
+
+STEP_KINDS = ('red', 'green', 'refactor', 'mixed')
+MERGE_STYLES = ('merge', 'ff')
+
+
+def run_git(path: str, *args) -> str:
+    return subprocess.run(['git', *args], cwd=path, check=True,
+                          capture_output=True, text=True).stdout.strip()
+
+
+def _function(k: int, refactored: bool = False) -> str:
+    if refactored:
+        return f"def f_{k}():\n    value = {k}\n    return value\n"
+    return f"def f_{k}():\n    return {k}\n"
+
+
+def _test(k: int) -> str:
+    return f"import calc\n\n\ndef test_f_{k}():\n    assert calc.f_{k}() == {k}\n"
+
+
+class KataRepo:
+    """A git repo on disk that synthetic TDD commits are written to."""
+
+    def __init__(self, path: str, suite_size: int = 0, salt: str = None):
+        """
+        suite_size passing tests go into test_suite.py of the initial commit;
+        a salt file makes the trees (and so the classification cache keys)
+        unique to this repo, and a tag in every commit message does the same
+        for the feedback cache keys.
+        """
+        self.path = path
+        self.tag = f" [{salt[:8]}]" if salt else ""
+        self.next_k = 1
+        self.failing = []        # k with a red test and no implementation
+        self.unrefactored = []   # k implemented and not refactored yet
+        os.makedirs(path, exist_ok=True)
+        run_git(path, 'init', '-q', '-b', 'main')
+        run_git(path, 'config', 'user.name', 'Synthetic Player')
+        run_git(path, 'config', 'user.email', 'player@example.com')
+        self._write('calc.py', "# kata\n")
+        if suite_size:
+            self._write('test_suite.py', "".join(
+                f"def test_suite_{i}():\n    assert {i} + 1 == {i + 1}\n\n\n"
+                for i in range(suite_size)))
+        if salt:
+            self._write('.kata-salt', salt + "\n")
+        self._commit("Initial commit")
+
+    def _write(self, name: str, content: str):
+        with open(os.path.join(self.path, name), 'w', encoding='utf-8') as f:
+            f.write(content)
+
+    def _edit_calc(self, old: str, new: str):
+        full = os.path.join(self.path, 'calc.py')
+        with open(full, encoding='utf-8') as f:
+            text = f.read()
+        self._write('calc.py', text.replace(old, new) if old else text + f"\n\n{new}")
+
+    def _commit(self, message: str) -> str:
+        run_git(self.path, 'add', '-A')
+        run_git(self.path, 'commit', '-q', '-m', message + self.tag)
+        return run_git(self.path, 'rev-parse', 'HEAD')
+
+    def possible_steps(self) -> list:
+        # one failing test at a time: green implements exactly that function,
+        # otherwise the other failing tests keep its commit from being green
+        kinds = ['mixed']
+        if self.failing:
+            kinds.append('green')
+        else:
+            kinds.append('red')
+        # refactoring only on a green suite, as classify_commit requires
+        if self.unrefactored and not self.failing:
+            kinds.append('refactor')
+        return kinds
+
+    def commit_step(self, kind: str) -> str:
+        """Write one commit of the given kind (see possible_steps) and return its SHA."""
+        if kind in ('red', 'mixed'):
+            k = self.next_k
+            self.next_k += 1
+            self._write(f'test_calc_{k}.py', _test(k))
+            if kind == 'red':
+                self.failing.append(k)
+                return self._commit(f"Add failing test for f_{k}")
+            self._edit_calc(None, _function(k))
+            self.unrefactored.append(k)
+            return self._commit(f"Add f_{k} with its test")
+        if kind == 'green':
+            k = self.failing.pop(0)
+            self._edit_calc(None, _function(k))
+            self.unrefactored.append(k)
+            return self._commit(f"Implement f_{k}")
+        if kind == 'refactor':
+            k = self.unrefactored.pop(0)
+            self._edit_calc(_function(k), _function(k, refactored=True))
+            return self._commit(f"Extract the result of f_{k} into a local")
+        raise ValueError(f"Unknown step kind: {kind!r}")
+
+    def next_commit(self):
+        """The next commit of an endless red -> green -> refactor sequence: (sha, kind)."""
+        if self.failing:
+            kind = 'green'
+        elif self.unrefactored:
+            kind = 'refactor'
+        else:
+            kind = 'red'
+        return self.commit_step(kind), kind
+
+    def start_branch(self, name: str):
+        run_git(self.path, 'checkout', '-q', '-b', name, 'main')
+
+    def merge_branch(self, name: str, style: str = 'merge') -> str:
+        """Merge branch into main ('merge': --no-ff merge commit, 'ff': fast-forward)."""
+        if style not in MERGE_STYLES:
+            raise ValueError(f"Unknown merge style: {style!r}")
+        run_git(self.path, 'checkout', '-q', 'main')
+        if style == 'merge':
+            run_git(self.path, 'merge', '-q', '--no-ff', '-m', f"Merge branch '{name}'", name)
+        else:
+            run_git(self.path, 'merge', '-q', '--ff-only', name)
+        return run_git(self.path, 'rev-parse', 'HEAD')
+
+    def push_to(self, target: str):
+        """
+        Move target's main to this repo's main without touching its working
+        tree (what the poller sees after a pull).
+        """
+        run_git(target, 'fetch', '-q', self.path, 'main')
+        run_git(target, 'update-ref', 'refs/heads/main', 'FETCH_HEAD')
+
+
+def generate_kata_repo(path: str, commits: int = 30, mix: dict = None, branches: int = 0,
+                       merge_style: str = 'merge', suite_size: int = 0, seed: int = 0,
+                       salt: str = None):
+    """
+    Build a kata repo at path with `commits` TDD commits (merge commits not
+    counted), drawing each step from the weights in mix (default: equal red,
+    green and refactor, no mixed) among the steps possible at that point.
+    With branches > 0 the commits are split into that many consecutive
+    feature branches (feature/1, ...), each merged into main with merge_style.
+
+    Returns (repo, steps) where steps lists (sha, kind) in commit order, kind
+    being one of STEP_KINDS or 'merge'.
+    """
+    mix = mix or {'red': 1, 'green': 1, 'refactor': 1}
+    rng = random.Random(seed)
+    repo = KataRepo(path, suite_size=suite_size, salt=salt)
+    steps = []
+
+    segments = [commits // branches + (1 if i < commits % branches else 0)
+                for i in range(branches)] if branches else [commits]
+    for n, size in enumerate(segments, start=1):
+        if branches:
+            repo.start_branch(f'feature/{n}')
+        for _ in range(size):
+            kinds = ([k for k in repo.possible_steps() if mix.get(k, 0) > 0]
+                     or ['green' if repo.failing else 'red'])
+            kind = rng.choices(kinds, weights=[mix.get(k, 0) or 1 for k in kinds])[0]
+            steps.append((repo.commit_step(kind), kind))
+        if branches:
+            sha = repo.merge_branch(f'feature/{n}', merge_style)
+            if merge_style == 'merge':
+                steps.append((sha, 'merge'))
+    return repo, steps
@@ -0,0 +1,37 @@
+import time
+
+import pytest
+
+pytest.importorskip('redis')
+fakeredis = pytest.importorskip('fakeredis')
+
+import db
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(db, 'redis_client', client)
+    return client
+
+
+def test_feedback_drops_commit_times(fake_redis):
+    now = time.time()
+    db.record_commits_seen('G', 'P', {'a' * 40: (now - 9, now - 3, now - 2),
+                                      'b' * 40: (now - 8, now - 2, now - 1)})
+    db.record_feedback_written('G', 'P', ['a' * 40])
+
+    times_key = db.commit_times_hash.format(game_id='G', player_id='P')
+    assert list(fake_redis.hkeys(times_key)) == ['b' * 40]
+    freshness = db.get_freshness_bulk('G', ['P'])['P']
+    assert freshness['pending'] == 1
+    assert freshness['last_lag'] >= 3
+
+
+def test_commit_times_expire(fake_redis):
+    now = time.time()
+    db.record_commits_seen('G', 'P', {'a' * 40: (now, now, now)})
+
+    for key in (db.commit_times_hash, db.pending_feedback_zset):
+        ttl = fake_redis.ttl(key.format(game_id='G', player_id='P'))
+        assert 0 < ttl <= db.COMMIT_TIMES_TTL
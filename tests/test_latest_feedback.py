@@ -0,0 +1,34 @@
+import pytest
+
+pytest.importorskip('redis')
+fakeredis = pytest.importorskip('fakeredis')
+
+import db
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    client = fakeredis.FakeRedis(decode_responses=True)
+    monkeypatch.setattr(db, 'redis_client', client)
+    return client
+
+
+def test_feedback_on_later_commits_wins(fake_redis):
+    assert db.set_latest_feedback('G', 'P', 5, 'commits 3-4')
+    assert not db.set_latest_feedback('G', 'P', 3, 'commits 0-2')
+
+    assert db.get_player('G', 'P')['latest_feedback'] == 'commits 3-4'
+
+
+def test_feedback_in_commit_order_is_stored(fake_redis):
+    assert db.set_latest_feedback('G', 'P', 3, 'commits 0-2')
+    assert db.set_latest_feedback('G', 'P', 5, 'commits 3-4')
+
+    assert db.get_player('G', 'P')['latest_feedback'] == 'commits 3-4'
+
+
+def test_reset_player_accepts_feedback_again(fake_redis):
+    db.set_latest_feedback('G', 'P', 5, 'old history')
+    db.reset_player('G', 'P')
+
+    assert db.set_latest_feedback('G', 'P', 1, 'new history')
@@ -0,0 +1,54 @@
+import pytest
+
+pytest.importorskip('redis')
+pytest.importorskip('openai')
+pytest.importorskip('httpx')
+pytest.importorskip('dotenv')
+
+import llm_analysis
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    """In-memory feedback cache and an LLM that records what it is sent."""
+    cache, sent = {}, []
+
+    def request(entries, system_prompt):
+        sent.append([e['commit'] for e in entries])
+        return {
+            'per_commit_feedback': [{'commit': e['commit'], 'feedback': f"fb {e['commit']}"}
+                                    for e in entries],
+            'overall_feedback': 'overall',
+        }
+
+    monkeypatch.setattr(llm_analysis, 'load_prompt', lambda: ('prompt', 'prompt-hash'))
+    monkeypatch.setattr(llm_analysis, 'get_cached_feedback', cache.get)
+    monkeypatch.setattr(llm_analysis, 'cache_feedback', cache.__setitem__)
+    monkeypatch.setattr(llm_analysis, '_request_llm_feedback', request)
+    return sent
+
+
+def _entry(sha, message):
+    return {
+        'commit': sha,
+        'message': message,
+        'branches': ['main'],
+        'feedback': '',
+        'analysis': {'commit_classify': 'green', 'tests_passed': True, 'is_refactoring': False},
+        'is_merge': False,
+    }
+
+
+def test_different_messages_miss_the_cache(fake_llm):
+    llm_analysis.analyze_commits_with_llm([_entry('a' * 40, 'Implement fizz')])
+    result = llm_analysis.analyze_commits_with_llm([_entry('b' * 40, 'Implement buzz')])
+
+    assert fake_llm == [['a' * 40], ['b' * 40]]
+    assert result['per_commit_feedback'][0]['feedback'] == f"fb {'b' * 40}"
+
+
+def test_same_message_hits_the_cache(fake_llm):
+    llm_analysis.analyze_commits_with_llm([_entry('a' * 40, 'Implement fizz')])
+    llm_analysis.analyze_commits_with_llm([_entry('b' * 40, 'Implement fizz')])
+
+    assert fake_llm == [['a' * 40]]
@@ -0,0 +1,58 @@
+import pytest
+
+pytest.importorskip('redis')
+openai = pytest.importorskip('openai')
+httpx = pytest.importorskip('httpx')
+pytest.importorskip('dotenv')
+
+import llm_analysis
+
+
+class FakeClient:
+    """chat.completions.create raising the given errors in turn, then answering."""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+        self.chat = self
+        self.completions = self
+
+    def create(self, **kwargs):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'answer'
+
+
+def _server_error():
+    request = httpx.Request('POST', 'http://llm.test/chat')
+    response = httpx.Response(503, request=request)
+    return openai.InternalServerError('unavailable', response=response, body=None)
+
+
+def _connection_error():
+    return openai.APIConnectionError(request=httpx.Request('POST', 'http://llm.test/chat'))
+
+
+@pytest.fixture(autouse=True)
+def no_waiting(monkeypatch):
+    monkeypatch.setattr(llm_analysis, 'LLM_TOKENS_PER_MINUTE', 0)
+    monkeypatch.setattr(llm_analysis.time, 'sleep', lambda seconds: None)
+
+
+MESSAGES = [{'role': 'user', 'content': 'hi'}]
+
+
+def test_transient_errors_are_retried():
+    client = FakeClient([_server_error(), _connection_error()])
+
+    assert llm_analysis._create_completion(client, MESSAGES, max_tokens=10) == 'answer'
+    assert client.calls == 3
+
+
+def test_transient_retries_are_bounded():
+    client = FakeClient([_server_error()] * (llm_analysis.LLM_TRANSIENT_RETRIES + 1))
+
+    with pytest.raises(openai.InternalServerError):
+        llm_analysis._create_completion(client, MESSAGES, max_tokens=10)
+    assert client.calls == llm_analysis.LLM_TRANSIENT_RETRIES + 1
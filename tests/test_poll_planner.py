@@ -0,0 +1,71 @@
+import time
+
+from poll_scheduler import AdaptivePollPlanner
+
+
+def test_fractional_rate_still_polls():
+    planner = AdaptivePollPlanner(min_interval=0.01, max_interval=1, rate=0.5)
+    planner.sync([('G', 'A'), ('G', 'B')])
+
+    assert len(planner.due()) == 1
+    assert planner.due() == []
+
+
+def test_fractional_rate_refills_one_poll(monkeypatch):
+    planner = AdaptivePollPlanner(min_interval=0.01, max_interval=1, rate=0.5)
+    planner.sync([('G', 'A'), ('G', 'B')])
+    first = planner.due()
+
+    clock = time.monotonic() + 2.1
+    monkeypatch.setattr(time, 'monotonic', lambda: clock)
+    second = planner.due()
+
+    assert len(second) == 1 and second != first
+
+
+def test_rate_caps_polls_per_tick():
+    planner = AdaptivePollPlanner(min_interval=0.01, max_interval=1, rate=3)
+    planner.sync([('G', str(i)) for i in range(5)])
+
+    assert len(planner.due()) == 3
+
+
+def test_idle_polls_back_off_and_activity_resets(monkeypatch):
+    planner = AdaptivePollPlanner(min_interval=1, max_interval=4, rate=10)
+    key = ('G', 'A')
+    clock = [time.time()]
+    monkeypatch.setattr(time, 'time', lambda: clock[0])
+    planner.sync([key])
+    for expected in (2, 4, 4):
+        assert planner.due() == [key]
+        planner.record(key, 0)
+        assert planner.snapshot()[key]['interval'] == expected
+        clock[0] += expected
+    assert planner.due() == [key]
+    planner.record(key, 3)
+
+    assert planner.snapshot()[key]['interval'] == 1
+
+
+def test_poke_while_polling_polls_again_at_once():
+    planner = AdaptivePollPlanner(min_interval=10, max_interval=100, rate=10)
+    key = ('G', 'A')
+    planner.sync([key])
+    planner.due()
+    planner.poke(key)
+    planner.record(key, 0)
+
+    assert planner.due() == [key]
+
+
+def test_record_returns_turnaround(monkeypatch):
+    planner = AdaptivePollPlanner(min_interval=1, max_interval=4, rate=10)
+    key = ('G', 'A')
+    clock = [time.time()]
+    monkeypatch.setattr(time, 'time', lambda: clock[0])
+    planner.sync([key])
+    planner.due()
+    clock[0] += 3
+
+    assert planner.record(key, 1) == 3
+    assert planner.record(key, 1) is None
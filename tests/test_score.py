@@ -0,0 +1,44 @@
+import copy
+import random
+
+from score import TDD_STEP_SCORES, new_score_state, score_all, score_incremental
+
+
+def _random_commits(rng, trial):
+    classes = list(TDD_STEP_SCORES) + ["merge"]
+    return [{
+        "commit":   f"{trial:04d}{k:036d}",
+        "branches": [],
+        "feedback": rng.choice(["", "Add test for fizz", "wip"]),
+        "analysis": {
+            "commit_classify": rng.choice(classes),
+            "tests_passed":    rng.random() < 0.5,
+            "is_refactoring":  rng.random() < 0.2,
+        },
+        "is_merge": rng.choice([False, 1]),
+    } for k in range(rng.randint(1, 40))]
+
+
+def test_incremental_scoring_matches_score_all():
+    """score_incremental fed random batch sizes agrees with score_all over the whole history."""
+    rng = random.Random(0)
+    for trial in range(500):
+        commits = _random_commits(rng, trial)
+
+        # score_all the way the poller used to: history + new, batch by batch
+        expected_history = []
+        state, history = new_score_state(), []
+        pos = 0
+        while pos < len(commits):
+            batch = commits[pos:pos + rng.randint(1, 6)]
+            pos += len(batch)
+            new_a = copy.deepcopy(batch)
+            expected = score_all(expected_history + new_a)
+            expected_history += new_a
+            new_b = copy.deepcopy(batch)
+            got = score_incremental(state, new_b)
+            history += new_b
+
+            assert got["overall_score"] == expected["overall_score"], trial
+            assert got["per_commit"] == expected["per_commit"][-len(batch):], trial
+        assert history == expected_history, trial
@@ -0,0 +1,37 @@
+import shutil
+
+import pytest
+
+pytest.importorskip('git')
+pytest.importorskip('redis')
+if shutil.which('git') is None:
+    pytest.skip('git is not installed', allow_module_level=True)
+
+import commit_analysis
+from synthetic_kata import generate_kata_repo
+
+
+@pytest.fixture
+def no_cache(monkeypatch):
+    """Keep classify_commit off the shared Redis caches."""
+    monkeypatch.setattr(commit_analysis, 'get_cached_tree_result', lambda tree: None)
+    monkeypatch.setattr(commit_analysis, 'cache_tree_result', lambda tree, result: None)
+    monkeypatch.setattr(commit_analysis, 'get_cached_refactor_result', lambda parent, tree: None)
+    monkeypatch.setattr(commit_analysis, 'cache_refactor_result', lambda parent, tree, value: None)
+
+
+@pytest.mark.parametrize('mix, seed, expected', [
+    ({'red': 1, 'green': 1, 'refactor': 1}, 1, 'refactor'),
+    # used to write two failing tests before a green step
+    ({'red': 5, 'green': 1}, 2, 'green'),
+])
+def test_steps_are_classified_as_generated(tmp_path, no_cache, mix, seed, expected):
+    repo, steps = generate_kata_repo(str(tmp_path / 'kata'), commits=6, mix=mix, seed=seed)
+    kinds = [kind for _, kind in steps]
+    assert expected in kinds
+
+    known = {}
+    for sha, kind in steps:
+        analysis = commit_analysis.classify_commit(repo.path, sha, known)
+        known[sha] = analysis
+        assert analysis['commit_classify'] == kind, (sha, kind)
@@ -0,0 +1,104 @@
+from contextlib import contextmanager
+
+import pytest
+
+pytest.importorskip('git')
+pytest.importorskip('redis')
+
+import commit_analysis
+
+
+@pytest.fixture
+def tree_cache(monkeypatch):
+    """Run evaluate_tree against a fake pytest report; returns the cache dict."""
+    cache = {}
+
+    @contextmanager
+    def snapshot(repo, sha):
+        yield sha     # run_pytest stand-ins get the commit SHA as path
+
+    monkeypatch.setattr(commit_analysis.git, 'Repo', lambda path: None)
+    monkeypatch.setattr(commit_analysis, 'commit_snapshot', snapshot)
+    monkeypatch.setattr(commit_analysis, 'get_cached_tree_result', cache.get)
+    monkeypatch.setattr(commit_analysis, 'cache_tree_result', cache.__setitem__)
+    return cache
+
+
+def _report(exitstatus, **extra):
+    return dict({'collected': 1, 'passed': exitstatus == 0, 'exitstatus': exitstatus,
+                 'outcomes': {}, 'timed_out': False}, **extra)
+
+
+@pytest.mark.parametrize('exitstatus', [None, 2, 3, 4])
+def test_infrastructure_failures_are_not_cached(tree_cache, monkeypatch, exitstatus):
+    monkeypatch.setattr(commit_analysis, 'run_pytest', lambda path: _report(exitstatus))
+    result = commit_analysis.evaluate_tree('/repo', 'c' * 40, 't' * 40)
+
+    assert result['tests_passed'] is False
+    assert tree_cache == {}
+
+
+@pytest.mark.parametrize('exitstatus', [0, 1, 5])
+def test_test_results_are_cached(tree_cache, monkeypatch, exitstatus):
+    monkeypatch.setattr(commit_analysis, 'run_pytest', lambda path: _report(exitstatus))
+    commit_analysis.evaluate_tree('/repo', 'c' * 40, 't' * 40)
+
+    assert list(tree_cache) == ['t' * 40]
+
+
+def test_timed_out_runs_are_not_cached_or_classified(tree_cache, monkeypatch):
+    monkeypatch.setattr(commit_analysis, 'run_pytest',
+                        lambda path: _report(None, collected=0, timed_out=True))
+    metadata = {'paths': ['calc.py'], 'parents': ['p' * 40], 'tree': 't' * 40,
+                'parent_tree': 'q' * 40}
+    analysis = commit_analysis.classify_commit('/repo', 'c' * 40, {}, metadata)
+
+    assert analysis['commit_classify'] == 'unknown'
+    assert tree_cache == {}
+
+
+@pytest.fixture
+def refactor_cache(tree_cache, monkeypatch):
+    """A commit that only rewrote calc.py, detected as a refactoring; returns the refactor cache."""
+    cache = {}
+    monkeypatch.setattr(commit_analysis, 'get_cached_refactor_result',
+                        lambda old, new: cache.get((old, new)))
+    monkeypatch.setattr(commit_analysis, 'cache_refactor_result',
+                        lambda old, new, value: cache.__setitem__((old, new), value))
+    monkeypatch.setattr(commit_analysis, '_detect_refactoring_between', lambda *args: True)
+    return cache
+
+
+REFACTOR_METADATA = {'paths': ['calc.py'], 'parents': ['p' * 40], 'tree': 't' * 40,
+                     'parent_tree': 'q' * 40}
+
+
+def test_refactor_after_green_parent_is_cached(refactor_cache, monkeypatch):
+    monkeypatch.setattr(commit_analysis, 'run_pytest', lambda path: _report(0))
+    known = {'p' * 40: {'commit_classify': 'green', 'tests_passed': True}}
+    analysis = commit_analysis.classify_commit('/repo', 'c' * 40, known, REFACTOR_METADATA)
+
+    assert analysis['commit_classify'] == 'refactor'
+    assert refactor_cache == {('q' * 40, 't' * 40): True}
+
+
+def test_refactor_after_red_parent_is_cached(refactor_cache, monkeypatch):
+    monkeypatch.setattr(commit_analysis, 'run_pytest', lambda path: _report(0))
+    known = {'p' * 40: {'commit_classify': 'red', 'tests_passed': False}}
+    analysis = commit_analysis.classify_commit('/repo', 'c' * 40, known, REFACTOR_METADATA)
+
+    assert analysis['commit_classify'] == 'green'
+    assert refactor_cache == {('q' * 40, 't' * 40): False}
+
+
+@pytest.mark.parametrize('parent_report', [_report(None, collected=0, timed_out=True),
+                                           _report(2), _report(None)])
+def test_inconclusive_parent_is_not_red(refactor_cache, monkeypatch, parent_report):
+    monkeypatch.setattr(commit_analysis, 'run_pytest',
+                        lambda path: parent_report if path == 'p' * 40 else _report(0))
+    known = {'p' * 40: {'commit_classify': 'unknown', 'tests_passed': False,
+                        'inconclusive': True}}
+    analysis = commit_analysis.classify_commit('/repo', 'c' * 40, known, REFACTOR_METADATA)
+
+    assert analysis['commit_classify'] == 'refactor'
+    assert refactor_cache == {}
@@ -0,0 +1,37 @@
+import pytest
+
+from webhooks import parse_push, push_payload, sign_payload, verify_signature
+
+
+def test_push_payload_round_trip():
+    assert parse_push(push_payload('Team/kata', after='abc')) == \
+        ('Team/kata', 'refs/heads/main', 'abc')
+
+
+@pytest.mark.parametrize('payload', [None, [], ['push'], 'push', 42])
+def test_non_object_payload_is_rejected(payload):
+    with pytest.raises(ValueError):
+        parse_push(payload)
+
+
+def test_null_after_becomes_empty():
+    payload = dict(push_payload('Team/kata'), after=None)
+
+    assert parse_push(payload) == ('Team/kata', 'refs/heads/main', '')
+
+
+@pytest.mark.parametrize('payload', [
+    {'zen': 'Keep it logically awesome.'},
+    {'ref': 'refs/heads/main', 'repository': 'Team/kata'},
+    {'ref': None, 'repository': {'full_name': 'Team/kata'}},
+])
+def test_payload_without_push_fields_is_not_a_push(payload):
+    assert parse_push(payload) is None
+
+
+def test_signature():
+    body = b'{"ref": "refs/heads/main"}'
+
+    assert verify_signature(body, sign_payload(body, 's3cret'), 's3cret')
+    assert not verify_signature(body, sign_payload(body, 'other'), 's3cret')
+    assert not verify_signature(body, sign_payload(body, 's3cret'), '')
@@ -0,0 +1,89 @@
+# webhooks.py
+# GitHub-style push webhooks, so a push is picked up right away instead of on
+# the player's next poll.
+#
+# Point the repository's webhook (content type application/json, "push"
+# events) at /tdd-game/webhook/push with TDD_WEBHOOK_SECRET as its secret.
+# The endpoint checks the X-Hub-Signature-256 HMAC, looks up the players
+# registered with the pushed repository and asks the poll planner to poll
+# them now. Polling stays on as the fallback for missed deliveries.
+#
+# A push can be simulated without GitHub:
+#
+#   python webhooks.py owner/repo --secret s3cret --url http://127.0.0.1:5000/tdd-game/webhook/push
+
+import argparse
+import hashlib
+import hmac
+import json
+import os
+import urllib.error
+import urllib.request
+
+WEBHOOK_SECRET = os.getenv('TDD_WEBHOOK_SECRET', '')
+
+# Branch whose pushes trigger a poll (the poller follows main)
+WEBHOOK_REF = 'refs/heads/main'
+
+
+def sign_payload(body: bytes, secret: str) -> str:
+    """X-Hub-Signature-256 value for body: 'sha256=<hex hmac>'."""
+    return 'sha256=' + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def verify_signature(body: bytes, signature: str, secret: str) -> bool:
+    """Whether signature (X-Hub-Signature-256) matches body; False without a secret."""
+    if not secret or not signature:
+        return False
+    return hmac.compare_digest(sign_payload(body, secret), signature)
+
+
+def parse_push(payload):
+    """
+    (repo_full_name, ref, head sha) of a push payload, or None if it is not
+    one. Raises ValueError if the payload is not a JSON object.
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("payload is not a JSON object")
+    repository = payload.get('repository')
+    repo = repository.get('full_name') if isinstance(repository, dict) else None
+    ref = payload.get('ref')
+    if not isinstance(repo, str) or not repo or not isinstance(ref, str):
+        return None
+    after = payload.get('after')
+    return repo, ref, after if isinstance(after, str) else ''
+
+
+def push_payload(repo_full_name: str, ref: str = WEBHOOK_REF, after: str = '') -> dict:
+    """The parts of a GitHub push payload the endpoint reads."""
+    return {'ref': ref, 'after': after, 'repository': {'full_name': repo_full_name}}
+
+
+def send_push(url: str, repo_full_name: str, secret: str, ref: str = WEBHOOK_REF,
+              after: str = ''):
+    """POST a signed push payload to url; returns (status, response body)."""
+    body = json.dumps(push_payload(repo_full_name, ref, after)).encode()
+    request = urllib.request.Request(url, data=body, method='POST', headers={
+        'Content-Type': 'application/json',
+        'X-GitHub-Event': 'push',
+        'X-Hub-Signature-256': sign_payload(body, secret),
+    })
+    try:
+        with urllib.request.urlopen(request, timeout=10) as response:
+            return response.status, response.read().decode()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Post a signed push webhook to the game server")
+    parser.add_argument('repo', help="repository full name, e.g. owner/repo (LOCAL/... for local players)")
+    parser.add_argument('--url', default='http://127.0.0.1:5000/tdd-game/webhook/push')
+    parser.add_argument('--secret', default=WEBHOOK_SECRET,
+                        help="defaults to TDD_WEBHOOK_SECRET")
+    parser.add_argument('--ref', default=WEBHOOK_REF)
+    parser.add_argument('--after', default='', help="head SHA after the push")
+    args = parser.parse_args()
+
+    status, text = send_push(args.url, args.repo, args.secret, args.ref, args.after)
+    print(status, text)